@@ -25,8 +25,11 @@ def and_thread(queues, count):
     for i in range(count):
         print "waiting"
         yield cond
-        for obj in cond.objects():
-            print "got %s from %r" % (obj.get(), obj)
+        # Take one round (two items) from each queue: whatever order
+        # the sub threads ran in, each queue holds at least one round
+        for q in queues:
+            for value in q.get_many(2):
+                print "got %s from %r" % (value, q)
 
 nb_queues = 3
 iterations = 2
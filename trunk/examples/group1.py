@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+import sys
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+
+# Usage: group1.py [nb_runs] [nb_switchers]
+# Starts and shuts down many switcher groups running a short softlet:
+# the group must always shut down cleanly, whichever switcher its
+# release reaches first.
+nb_runs = len(sys.argv) > 1 and int(sys.argv[1]) or 500
+nb_switchers = len(sys.argv) > 2 and int(sys.argv[2]) or 4
+
+def short_thread():
+    yield softlets.Ready()
+
+for i in xrange(nb_runs):
+    group = softlets.SwitcherGroup(nb_switchers)
+    group.spawn(short_thread())
+    group.run()
+print "Shut down %d groups of %d switchers" % (nb_runs, nb_switchers)
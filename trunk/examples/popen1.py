@@ -17,19 +17,23 @@ clock_symbols = "-/|\\"
 if len(sys.argv) > 1:
     command = sys.argv[1:]
 
-print "Execute a command in a subprocess and wait for completion"
+print "Execute a command in a subprocess and stream its output"
 
 def main_thread():
     print "Executing \"%s\" ..." % ' '.join(command)
-    popen = Popen(command, stdout=PIPE, stderr=PIPE)
+    popen = Popen(command, stdout=PIPE)
+    out = popen.stdout
     clock = itertools.cycle(clock_symbols)
-    while not popen.finished:
+    while not out.eof:
         print "\r" + clock.next(),
         sys.stdout.flush()
-        yield popen | Timer(tick)
+        yield out | Timer(tick)
+        line = out.readline()
+        while line:
+            print "\r" + line,
+            line = out.readline()
+    yield popen
     print "\rResult code =", popen.retcode
-    print "Output:"
-    print popen.popen.communicate()[0]
 
 softlets.Softlet(main_thread())
 softlets.main_loop()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+import sys
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.popen import Popen, PIPE
+
+
+# Checks that pipes of a Popen object can be used either through the
+# underlying subprocess.Popen object (blocking calls) or through the
+# Popen's PipeReader/PipeWriter objects.
+
+def main_thread():
+    # Blocking use of the pipes
+    popen = Popen(["echo", "hi"], stdout=PIPE)
+    out, err = popen.popen.communicate()
+    assert out == 'hi\n', out
+    yield popen
+    print "communicate() returned %r" % out
+    # Streaming through the softlets wrappers
+    popen = Popen(["cat"], stdin=PIPE, stdout=PIPE)
+    assert popen.stderr is None
+    yield popen.stdin
+    popen.stdin.write('hello\n')
+    popen.stdin.close()
+    out = popen.stdout
+    lines = []
+    while not out.eof:
+        yield out
+        line = out.readline()
+        if line:
+            lines.append(line)
+    yield popen
+    assert lines == ['hello\n'], lines
+    print "Read %r from the PipeReader" % lines[0]
+
+softlets.Softlet(main_thread())
+softlets.main_loop()
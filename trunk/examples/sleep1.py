@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+
+# Checks that sleep() timers don't outlive their purpose:
+# - killing a sleeping softlet cancels its timer
+# - a sleep() result which isn't yielded doesn't wake up a later sleep
+
+switcher = softlets.current_switcher()
+
+def sleeper():
+    yield softlets.sleep(3600)
+
+def killer():
+    thread = softlets.Softlet(sleeper(), standalone=True)
+    yield softlets.Ready()
+    assert len(switcher.timers) == 1
+    thread.terminate()
+    assert len(switcher.timers) == 0
+    print "Killed a sleeping softlet, its timer is gone"
+
+def unyielded():
+    softlets.sleep(0.01)
+    t = time.time()
+    yield softlets.sleep(0.2)
+    dt = time.time() - t
+    assert dt >= 0.2, dt
+    print "Slept %.2f seconds" % dt
+
+softlets.Softlet(killer())
+softlets.main_loop()
+softlets.Softlet(unyielded())
+softlets.main_loop()
@@ -15,15 +15,27 @@ def looping_thread(count):
     for i in xrange(count):
         yield cond
 
+def yielding_thread(count):
+    for i in xrange(count):
+        yield
+
+# Usage: stress1.py [nb_threads] [batch_size] [ready|none]
+# With "none", softlets yield None instead of the Ready object.
 nb_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 1000
+batch_size = len(sys.argv) > 2 and int(sys.argv[2]) or 1
+mode = len(sys.argv) > 3 and sys.argv[3] or 'ready'
 iterations = 100
 
 def setup_threads():
+    if mode == 'none':
+        func = yielding_thread
+    else:
+        func = looping_thread
     for i in xrange(nb_threads):
-        softlets.Softlet(looping_thread(iterations))
+        softlets.Softlet(func(iterations))
 
 def run_threads():
-    softlets.main_loop()
+    softlets.main_loop(batch_size=batch_size)
 
 def duration(fun):
     import time
@@ -37,6 +49,7 @@ def duration(fun):
 dt = duration(lambda: setup_threads())
 print "Setup %d threads in %f seconds" % (nb_threads, dt)
 dt = duration(lambda: run_threads())
-print "Switched %d times between %d threads in %f seconds" % \
-    (softlets.current_switcher().nb_switches, nb_threads, dt)
+n = softlets.current_switcher().nb_switches
+print "Switched %d times between %d threads in %f seconds (batch size %d, %d switches/s)" % \
+    (n, nb_threads, dt, batch_size, n / dt)
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.shards import Shards
+
+
+# Usage: stress10.py [nb_threads] [max_processes] [nb_messages]
+# Runs the stress1.py workload (nb_threads softlets looping on Ready)
+# split over 1, 2, 4... processes, then measures the throughput of
+# the cross-process queues by passing messages around a ring of shards.
+nb_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+max_processes = len(sys.argv) > 2 and int(sys.argv[2]) or 8
+nb_messages = len(sys.argv) > 3 and int(sys.argv[3]) or 100000
+iterations = 100
+
+def looping_thread(count):
+    cond = softlets.Ready()
+    for i in xrange(count):
+        yield cond
+
+def looping_shard(shards, nb_threads):
+    for i in xrange(nb_threads):
+        softlets.Softlet(looping_thread(iterations), standalone=True)
+    # Let the other softlets run until they are finished
+    cond = softlets.Ready()
+    switcher = softlets.current_switcher()
+    while len(switcher.threads) > 1:
+        yield cond
+    shards.send(None, switcher.nb_switches)
+
+def ring_shard(shards, nb_messages):
+    me = shards.index
+    next = (me + 1) % shards.nb_shards
+    inbox = shards.inbox
+    if me == 0:
+        for i in xrange(nb_messages):
+            shards.send(next, i)
+    nb_received = 0
+    while nb_received < nb_messages:
+        yield inbox
+        value = inbox.get()
+        nb_received += 1
+        if me != 0:
+            shards.send(next, value)
+    shards.send(None, nb_received)
+
+def collect(shards, results):
+    inbox = shards.inbox
+    while len(results) < shards.nb_shards:
+        yield inbox
+        results.append(inbox.get())
+
+def run_sharded(nb_processes, func, *args):
+    shards = Shards(nb_processes)
+    t1 = time.time()
+    shards.start(func, *args)
+    results = []
+    softlets.Softlet(collect(shards, results))
+    softlets.main_loop()
+    assert shards.wait() == [0] * nb_processes
+    return time.time() - t1, results
+
+base = None
+nb_processes = 1
+while nb_processes <= max_processes:
+    dt, results = run_sharded(nb_processes, looping_shard,
+        nb_threads // nb_processes)
+    base = base or dt
+    print "%d processes: switched %d times between %d threads in %f seconds (speedup %.2f)" % (
+        nb_processes, sum(results), nb_threads, dt, base / dt)
+    nb_processes *= 2
+
+dt, results = run_sharded(2, ring_shard, nb_messages)
+print "Passed %d messages between 2 processes in %f seconds (%.0f per second)" % (
+    2 * nb_messages, dt, 2 * nb_messages / dt)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.timer import Timer
+from softlets.popen import Popen
+
+
+# Usage: stress11.py [nb_switchers] [nb_threads] [nb_processes]
+# Protected WaitObjects (helper thread timers, subprocesses) are
+# waited upon by softlets running on several switchers, while helper
+# threads make them ready: this measures lock contention.
+nb_switchers = len(sys.argv) > 1 and int(sys.argv[1]) or 4
+nb_threads = len(sys.argv) > 2 and int(sys.argv[2]) or 10000
+nb_processes = len(sys.argv) > 3 and int(sys.argv[3]) or 200
+nb_sleeps = 5
+delay = 0.01
+
+def timer_thread():
+    for i in xrange(nb_sleeps):
+        yield Timer(delay)
+
+def popen_thread():
+    p = Popen(["true"])
+    yield p
+
+def run_threads(func, n):
+    group = softlets.SwitcherGroup(nb_switchers)
+    for i in xrange(n):
+        group.spawn(func())
+    group.run()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+n = nb_threads * nb_sleeps
+dt = duration(lambda: run_threads(timer_thread, nb_threads))
+print "%d timers on %d switchers in %f seconds (%d per second)" % (
+    n, nb_switchers, dt, n / dt)
+dt = duration(lambda: run_threads(popen_thread, nb_processes))
+print "%d subprocesses on %d switchers in %f seconds (%d per second)" % (
+    nb_processes, nb_switchers, dt, nb_processes / dt)
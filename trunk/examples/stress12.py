@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import os
+import sys
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+
+# Usage: stress12.py [max_threads]
+# Reports the memory used by idle softlets (created but not run yet),
+# from the resident size of the process (Linux only).
+# Each count is measured in a forked process, from a clean heap.
+max_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 1000000
+page_size = os.sysconf('SC_PAGE_SIZE')
+
+def rss():
+    f = open('/proc/self/statm')
+    try:
+        return int(f.read().split()[1]) * page_size
+    finally:
+        f.close()
+
+def idle_thread():
+    yield softlets.Ready()
+
+def measure(n):
+    switcher = softlets.current_switcher()
+    before = rss()
+    for i in xrange(n):
+        softlets.Softlet(idle_thread())
+    after = rss()
+    assert len(switcher.threads) == n
+    return after - before
+
+def run_child(n):
+    r, w = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(r)
+        os.write(w, str(measure(n)))
+        os._exit(0)
+    os.close(w)
+    data = os.read(r, 100)
+    os.close(r)
+    os.waitpid(pid, 0)
+    return int(data)
+
+n = 10000
+while n <= max_threads:
+    used = run_child(n)
+    print "%8d idle softlets: %8d KB, %d bytes each" % (n, used // 1024, used // n)
+    n *= 10
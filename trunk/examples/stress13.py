@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.queue import Queue
+
+
+# Usage: stress13.py [iterations] [nb_pairs]
+# Pairs of softlets exchanging values through two queues, as in ex1.py.
+iterations = len(sys.argv) > 1 and int(sys.argv[1]) or 1000000
+nb_pairs = len(sys.argv) > 2 and int(sys.argv[2]) or 1
+
+def thread_a(n, qin, qout):
+    for i in xrange(n):
+        qout.put(i)
+        yield qin
+        qin.get()
+
+def thread_b(n, qin, qout):
+    for i in xrange(n):
+        yield qin
+        qout.put(qin.get())
+
+def setup_threads():
+    for i in xrange(nb_pairs):
+        q1 = Queue()
+        q2 = Queue()
+        softlets.Softlet(thread_a(iterations, q1, q2))
+        softlets.Softlet(thread_b(iterations, q2, q1))
+
+def run_threads():
+    softlets.main_loop()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+setup_threads()
+dt = duration(lambda: run_threads())
+n = iterations * nb_pairs
+print "%d round trips between %d pairs in %f seconds (%.2f us each, %d switches/s)" % (
+    n, nb_pairs, dt, dt * 1e6 / n, softlets.current_switcher().nb_switches / dt)
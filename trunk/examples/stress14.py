@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.core import WaitObject
+
+
+# Usage: stress14.py [nb_threads] [branching]
+# Builds a tree of softlets (each one spawning up to "branching"
+# children), then terminates the root, which tears down the tree.
+# Trees are built breadth-first: branching 1 gives a chain.
+nb_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 100000
+branchings = len(sys.argv) > 2 and [int(sys.argv[2])] or [nb_threads, 10, 1]
+
+# Never ready
+forever = WaitObject()
+
+def tree_thread(state, branching):
+    for i in xrange(branching):
+        if state[0] >= nb_threads:
+            break
+        state[0] += 1
+        softlets.Softlet(tree_thread(state, branching))
+    yield forever
+
+def killer_thread(root, state, times):
+    while state[0] < nb_threads:
+        yield softlets.Ready()
+    t1 = time.time()
+    root.terminate()
+    times.append(time.time() - t1)
+
+def run_tree(branching):
+    state = [1]
+    times = []
+    root = softlets.Softlet(tree_thread(state, branching))
+    softlets.Softlet(killer_thread(root, state, times), standalone=True)
+    softlets.main_loop()
+    return times[0]
+
+for branching in branchings:
+    dt = run_tree(branching)
+    print "Terminated a tree of %d softlets (branching %d) in %f seconds (%.2f us each)" % (
+        nb_threads, branching, dt, dt * 1e6 / nb_threads)
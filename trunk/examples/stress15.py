@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.core import WaitObject
+
+
+# Usage: stress15.py [max_objects]
+# Compares logical expressions built with the |, & and ~ operators
+# with the flattened ones built by any_of() and all_of():
+# - "or": any of N objects
+# - "mixed": (o0 & ~o1) | (o2 & ~o3) | ...
+# Reports the time to build the expression, and the cost of a
+# readiness change of one of the objects.
+max_objects = len(sys.argv) > 1 and int(sys.argv[1]) or 10000
+nb_changes = 100000
+
+def or_operators(objs):
+    cond = None
+    for obj in objs:
+        cond = cond | obj
+    return cond
+
+def or_flat(objs):
+    return softlets.any_of(objs)
+
+def mixed_operators(objs):
+    cond = None
+    for i in xrange(0, len(objs), 2):
+        cond = cond | (objs[i] & ~objs[i + 1])
+    return cond
+
+def mixed_flat(objs):
+    return softlets.any_of([softlets.all_of([objs[i], ~objs[i + 1]])
+        for i in xrange(0, len(objs), 2)])
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+def run(build, n):
+    objs = [WaitObject() for i in xrange(n)]
+    result = []
+    dt_build = duration(lambda: result.append(build(objs)))
+    cond = result[0]
+    # Arm the expression
+    cond.notify_readiness(lambda obj, ready: None)
+    def changes():
+        for i in xrange(nb_changes):
+            obj = objs[(i * 7) % n]
+            obj.set_ready(not obj.ready)
+    dt_changes = duration(changes)
+    return dt_build, dt_changes
+
+n = 10
+while n <= max_objects:
+    for name, build in [
+            ('or (operators)', or_operators), ('or (any_of)', or_flat),
+            ('mixed (operators)', mixed_operators), ('mixed (flat)', mixed_flat)]:
+        dt_build, dt_changes = run(build, n)
+        print "%6d objects, %-18s built in %f seconds, %.2f us per change" % (
+            n, name, dt_build, dt_changes * 1e6 / nb_changes)
+    n *= 10
@@ -8,19 +8,42 @@ except ImportError:
     import _autopath, softlets
 
 from softlets.timer import Timer
+from softlets.timethread import TimingWheel
 
 
+# Usage: stress2.py [nb_threads] [nb_reschedules] [heap|wheel] [slack]
+# Prefixing the backend with "switcher-" (e.g. "switcher-heap") lets the
+# switcher run the timers itself instead of the helper thread.
 nb_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 2000
+nb_reschedules = len(sys.argv) > 2 and int(sys.argv[2]) or 0
+backend = len(sys.argv) > 3 and sys.argv[3] or 'heap'
+Timer.slack = len(sys.argv) > 4 and float(sys.argv[4]) or 0.0
 nb_sleeps = 0
 nb_simult = 0
 max_simult = 0
+reschedule_time = 0.0
 abs_delay = 1.0
 target = time.time() + abs_delay
 
+if backend.startswith('switcher-'):
+    if backend == 'switcher-wheel':
+        softlets.current_switcher().enable_timers(TimingWheel())
+    else:
+        softlets.current_switcher().enable_timers()
+elif backend == 'wheel':
+    Timer.timethread.set_timers(TimingWheel())
+
 def sleeping_thread():
-    global nb_simult, nb_sleeps, max_simult
+    global nb_simult, nb_sleeps, max_simult, reschedule_time
     nb_simult += 1
-    yield Timer(max(0.0, target - time.time()))
+    timer = Timer(max(0.0, target - time.time()))
+    if nb_reschedules:
+        # Simulate timeouts which are pushed back again and again
+        t1 = time.time()
+        for i in xrange(nb_reschedules):
+            timer.reschedule()
+        reschedule_time += time.time() - t1
+    yield timer
     max_simult = max(max_simult, nb_simult)
     nb_simult -= 1
     nb_sleeps += 1
@@ -44,4 +67,10 @@ dt = duration(lambda: setup_threads())
 print "Setup %d threads in %f seconds" % (nb_threads, dt)
 dt = duration(lambda: run_threads())
 print "Ran up to %d simultaneous timers in %f seconds" % (max_simult, dt)
-
+switcher = softlets.current_switcher()
+print "%d async calls and %d async records into the switcher (slack %s)" % (
+    switcher.nb_async_calls, switcher.nb_async_records, Timer.slack)
+if nb_reschedules:
+    n = nb_threads * nb_reschedules
+    print "Rescheduled %d times in %f seconds (%s backend, %.1f us each)" % (
+        n, reschedule_time, backend, reschedule_time * 1e6 / n)
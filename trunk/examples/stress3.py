@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import random
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.queue import Queue, PriorityQueue, LifoQueue
+
+
+max_items = len(sys.argv) > 1 and int(sys.argv[1]) or 1000000
+sizes = []
+n = 1000
+while n <= max_items:
+    sizes.append(n)
+    n *= 10
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+def fill_and_drain(cls, values):
+    q = cls()
+    put = q.put
+    get = q.get
+    def fill():
+        for v in values:
+            put(v)
+    def drain():
+        for v in values:
+            get()
+    return duration(fill), duration(drain)
+
+def fill_and_drain_many(cls, values, chunk=100):
+    q = cls()
+    chunks = [values[i:i + chunk] for i in xrange(0, len(values), chunk)]
+    def fill():
+        for c in chunks:
+            q.put_many(c)
+    def drain():
+        for c in chunks:
+            q.get_many(chunk)
+    return duration(fill), duration(drain)
+
+print "Per-item cost in microseconds (put / get, then put_many / get_many)"
+for cls in (Queue, LifoQueue, PriorityQueue):
+    for n in sizes:
+        values = [(random.random(), i) for i in xrange(n)]
+        t_put, t_get = fill_and_drain(cls, values)
+        t_putm, t_getm = fill_and_drain_many(cls, values)
+        print "%-14s %8d items: %6.3f / %6.3f    %6.3f / %6.3f" % (
+            cls.__name__, n,
+            t_put * 1e6 / n, t_get * 1e6 / n,
+            t_putm * 1e6 / n, t_getm * 1e6 / n)
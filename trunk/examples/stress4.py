@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.timer import Timer
+
+
+# Usage: stress4.py [nb_threads] [sleep|timer|thread-timer]
+# "timer" yields Timer objects run by the switcher,
+# "thread-timer" yields Timer objects run by the helper thread.
+nb_threads = len(sys.argv) > 1 and int(sys.argv[1]) or 100000
+mode = len(sys.argv) > 2 and sys.argv[2] or 'sleep'
+nb_sleeps = 5
+delay = 0.1
+
+if mode != 'thread-timer':
+    softlets.current_switcher().enable_timers()
+
+def sleeping_thread():
+    for i in xrange(nb_sleeps):
+        yield softlets.sleep(delay)
+
+def timer_thread():
+    for i in xrange(nb_sleeps):
+        yield Timer(delay)
+
+def setup_threads():
+    if mode == 'sleep':
+        func = sleeping_thread
+    else:
+        func = timer_thread
+    for i in xrange(nb_threads):
+        softlets.Softlet(func())
+
+def run_threads():
+    softlets.main_loop()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+dt = duration(lambda: setup_threads())
+print "Setup %d threads in %f seconds" % (nb_threads, dt)
+dt = duration(lambda: run_threads())
+n = nb_threads * nb_sleeps
+print "Slept %d times (%s) in %f seconds, %.1f us overhead per sleep" % (
+    n, mode, dt, (dt - nb_sleeps * delay) * 1e6 / n)
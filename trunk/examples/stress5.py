@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import resource
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.popen import Popen, PIPE
+
+
+# Usage: stress5.py [nb_megabytes]
+# Streams data through "cat": one softlet feeds its stdin while
+# another consumes its stdout, so memory use stays constant.
+nb_megabytes = len(sys.argv) > 1 and int(sys.argv[1]) or 256
+chunk = 'x' * 65536
+nb_chunks = nb_megabytes * 16
+nb_read = 0
+
+popen = Popen(["cat"], stdin=PIPE, stdout=PIPE)
+
+def writer_thread():
+    w = popen.stdin
+    for i in xrange(nb_chunks):
+        data = buffer(chunk)
+        while data:
+            yield w
+            data = buffer(data, w.write(data))
+    w.close()
+
+def reader_thread():
+    global nb_read
+    r = popen.stdout
+    while not r.eof:
+        yield r
+        nb_read += len(r.read())
+    yield popen
+
+def run_threads():
+    softlets.Softlet(writer_thread())
+    softlets.Softlet(reader_thread())
+    softlets.main_loop()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+dt = duration(lambda: run_threads())
+assert nb_read == nb_chunks * len(chunk)
+print "Streamed %d MB through a subprocess in %f seconds (%.1f MB/s)" % (
+    nb_megabytes, dt, nb_megabytes / dt)
+print "Max resident memory: %d KB" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
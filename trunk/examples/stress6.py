@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+import signal
+import socket
+import resource
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+
+# Usage: stress6.py [nb_connections,...] [duration]
+# Loopback echo benchmark: a server process echoes lines back, the
+# clients (in this process) send requests in lockstep on every
+# connection, and the latency of each request is measured.
+counts = [1000, 10000, 50000]
+if len(sys.argv) > 1:
+    counts = [int(s) for s in sys.argv[1].split(',')]
+run_time = len(sys.argv) > 2 and float(sys.argv[2]) or 5.0
+message = 'x' * 63 + '\n'
+# Connections per listening port, to stay within the ephemeral port range
+per_port = 20000
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+def server_process(socks):
+    from softlets.net import Listener
+    def handler(stream):
+        while True:
+            f = stream.readline()
+            yield f
+            line = f.get()
+            if not line:
+                break
+            stream.write(line)
+        stream.close()
+    def acceptor(listener):
+        while True:
+            f = listener.accept()
+            yield f
+            stream, address = f.get()
+            softlets.Softlet(handler(stream), standalone=True)
+    for sock in socks:
+        softlets.Softlet(acceptor(Listener(sock)))
+    softlets.main_loop()
+
+def run_clients(nb_connections, ports):
+    from softlets.net import connect
+    latencies = []
+    streams = []
+    start = softlets.WaitObject()
+    _t = time.time
+    def client(port):
+        f = connect(('127.0.0.1', port))
+        yield f
+        stream = f.get()
+        streams.append(stream)
+        if len(streams) == nb_connections:
+            start.set_ready(True)
+        yield start
+        end = started[0] + run_time
+        while True:
+            t1 = _t()
+            if t1 >= end:
+                break
+            stream.write(message)
+            f = stream.readline()
+            yield f
+            f.get()
+            latencies.append(_t() - t1)
+        stream.close()
+    started = []
+    def timer():
+        yield start
+        started.append(_t())
+    softlets.Softlet(timer())
+    for i in xrange(nb_connections):
+        softlets.Softlet(client(ports[i // per_port]))
+    t1 = _t()
+    softlets.main_loop()
+    return latencies, started[0] - t1
+
+def bench(nb_connections):
+    socks = []
+    for i in xrange((nb_connections + per_port - 1) // per_port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(4096)
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    # The server must be forked before the switcher is created
+    pid = os.fork()
+    if not pid:
+        try:
+            server_process(socks)
+        finally:
+            os._exit(0)
+    for sock in socks:
+        sock.close()
+    try:
+        latencies, setup_time = run_clients(nb_connections, ports)
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    latencies.sort()
+    n = len(latencies)
+    p99 = latencies[min(n - 1, int(n * 0.99))]
+    print "%6d connections: %8.0f requests/s, p99 latency %.2f ms (connected in %.2f s)" % (
+        nb_connections, n / run_time, p99 * 1e3, setup_time)
+
+limit = raise_fd_limit()
+for nb_connections in counts:
+    # Each process needs one fd per connection, plus a few
+    if nb_connections + 100 > limit:
+        print "%6d connections: skipped, file descriptor limit is %d" % (
+            nb_connections, limit)
+        continue
+    bench(nb_connections)
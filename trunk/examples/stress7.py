@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.pool import default_pool
+
+
+# Usage: stress7.py [nb_calls] [pool_size]
+nb_calls = len(sys.argv) > 1 and int(sys.argv[1]) or 100000
+pool_size = len(sys.argv) > 2 and int(sys.argv[2]) or 8
+nb_blocking = 200
+block_time = 0.01
+default_pool().set_size(pool_size)
+
+def offloading_thread(func, *args):
+    f = softlets.offload(func, *args)
+    yield f
+    f.get()
+
+def blocking_thread(func, *args):
+    func(*args)
+    yield softlets.Ready()
+
+def run_threads(thread, n, func, *args):
+    for i in xrange(n):
+        softlets.Softlet(thread(func, *args))
+    softlets.main_loop()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+switcher = softlets.current_switcher()
+dt = duration(lambda: run_threads(offloading_thread, nb_calls, abs, 1))
+print "Offloaded %d calls in %f seconds (%.1f us each), %d async calls" % (
+    nb_calls, dt, dt * 1e6 / nb_calls, switcher.nb_async_calls)
+dt = duration(lambda: run_threads(blocking_thread, nb_blocking, time.sleep, block_time))
+print "%d blocking calls of %s s made inline in %f seconds" % (
+    nb_blocking, block_time, dt)
+dt = duration(lambda: run_threads(offloading_thread, nb_blocking, time.sleep, block_time))
+print "%d blocking calls of %s s offloaded to %d threads in %f seconds" % (
+    nb_blocking, block_time, pool_size, dt)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+from softlets.pool import default_process_pool
+
+
+# Usage: stress8.py [nb_tasks] [work] [nb_processes]
+# Each task is a CPU-bound loop of "work" iterations.
+nb_tasks = len(sys.argv) > 1 and int(sys.argv[1]) or 10000
+work = len(sys.argv) > 2 and int(sys.argv[2]) or 1000
+nb_processes = len(sys.argv) > 3 and int(sys.argv[3]) or None
+pool = default_process_pool()
+pool.size = nb_processes
+
+def task(n):
+    s = 0
+    for i in xrange(n):
+        s += i * i
+    return s
+
+def inline_thread():
+    results = [task(work) for i in xrange(nb_tasks)]
+    yield softlets.Ready()
+
+def process_thread():
+    futures = [softlets.run_in_process(task, work) for i in xrange(nb_tasks)]
+    for f in futures:
+        yield f
+        f.get()
+
+def map_thread():
+    f = softlets.map_in_process(task, [work] * nb_tasks)
+    yield f
+    assert len(f.get()) == nb_tasks
+
+def run_thread(func):
+    softlets.Softlet(func())
+    softlets.main_loop()
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+# Start the worker processes beforehand
+run_thread(map_thread)
+switcher = softlets.current_switcher()
+for name, func in [('inline', inline_thread),
+        ('run_in_process', process_thread), ('map_in_process', map_thread)]:
+    n = switcher.nb_async_calls
+    dt = duration(lambda: run_thread(func))
+    print "%d tasks (%s) in %f seconds with %d processes, %d async calls" % (
+        nb_tasks, name, dt, pool.size, switcher.nb_async_calls - n)
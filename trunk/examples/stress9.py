@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import sys
+import time
+try:
+    import softlets
+except ImportError:
+    import _autopath, softlets
+
+
+# Usage: stress9.py [nb_switchers] [nb_threads] [spread|steal]
+# Each softlet makes blocking calls which release the GIL.
+# With "spread", softlets are spawned onto the least loaded switchers.
+# With "steal", they are all spawned onto the first switcher and
+# the other switchers have to steal them.
+nb_switchers = len(sys.argv) > 1 and int(sys.argv[1]) or 4
+nb_threads = len(sys.argv) > 2 and int(sys.argv[2]) or 100
+mode = len(sys.argv) > 3 and sys.argv[3] or 'spread'
+nb_steps = 10
+block_time = 0.001
+
+def blocking_thread():
+    for i in xrange(nb_steps):
+        time.sleep(block_time)
+        yield softlets.Ready()
+
+def run_threads():
+    group = softlets.SwitcherGroup(nb_switchers)
+    first = group.switchers[0]
+    for i in xrange(nb_threads):
+        if mode == 'steal':
+            group.spawn(blocking_thread(), first)
+        else:
+            group.spawn(blocking_thread())
+    group.run()
+    return group
+
+def duration(fun):
+    _t = time.time
+    _f = fun
+    t1 = _t()
+    _f()
+    t2 = _t()
+    return t2 - t1
+
+n = nb_threads * nb_steps
+dt = duration(lambda: run_threads())
+print "%d blocking calls of %s s on %d switchers (%s) in %f seconds (%.1fx parallelism)" % (
+    n, block_time, nb_switchers, mode, dt, n * block_time / dt)
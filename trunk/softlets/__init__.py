@@ -4,3 +4,4 @@ Softlets: a pure Python cooperative multithreading package.
 """
 
 from softlets.core import *
+from softlets.pool import offload, run_in_process, map_in_process
@@ -4,3 +4,5 @@ Softlets core machinery.
 
 from softlets.core.switcher import *
 from softlets.core.errors import *
+from softlets.core.group import *
+from softlets.core.waitobject import LogicalExpression, any_of, all_of
@@ -5,7 +5,9 @@ Common base stuff.
 import threading
 
 __all__ = [
-    '_singleton', '_lock', '_protect', '_unprotect',
+    '_singleton', '_local_singleton', '_lock', '_stripe_lock',
+    '_protect', '_unprotect', '_threaded', '_set_threaded',
+    '_set_single_threaded',
     ]
 
 
@@ -15,19 +17,42 @@ def _singleton(cls):
         if not instance:
             instance.append(cls(*args, **kargs))
         return instance[0]
+    def reset():
+        # Forget the instance (e.g. in a forked child)
+        del instance[:]
+    wrapper.reset = reset
     return wrapper
 
-# def _local_singleton(cls):
-#     instances = {}
-#     def wrapper(*args, **kargs):
-#         switcher = current_switcher()
-#         try:
-#             instance = instances[switcher]
-#         except KeyError:
-#             instance = cls(*args, **kargs)
-#             instances[switcher] = instance
-#         return instance
-#     return wrapper
+def _local_singleton(cls):
+    # One instance per OS thread
+    local = threading.local()
+    def wrapper(*args, **kargs):
+        try:
+            return local.instance
+        except AttributeError:
+            instance = cls(*args, **kargs)
+            local.instance = instance
+            return instance
+    def reset():
+        # Forget the current thread's instance (e.g. in a forked child)
+        local.__dict__.pop('instance', None)
+    wrapper.reset = reset
+    return wrapper
+
+#
+# Single-threaded fast mode: only when asked explicitly (see
+# set_single_threaded()), switchers skip the checks for out-of-thread
+# calls. The mode is left for good as soon as other OS threads are
+# known to be involved (a WaitObject is protect()'ed, or a second
+# switcher is created).
+#
+_threaded = [True]
+
+def _set_threaded():
+    _threaded[0] = True
+
+def _set_single_threaded():
+    _threaded[0] = False
 
 #
 # To be used when other threads have to interact with
@@ -35,6 +60,15 @@ def _singleton(cls):
 #
 _lock = threading.RLock()
 
+# Striped lock table: unrelated objects most probably get different
+# locks, without allocating a lock for each object
+_nb_stripes = 64
+_stripes = [threading.RLock() for i in xrange(_nb_stripes)]
+
+def _stripe_lock(obj):
+    # Objects are at least 8-byte aligned, don't waste stripes
+    return _stripes[(id(obj) >> 3) % _nb_stripes]
+
 def _protect(func, lock=None):
     lock = lock or _lock
     try:
@@ -25,3 +25,13 @@ class Starvation(Error):
     This means all softlets are waiting but none can be woken up,
     and there are no async objects.
     """
+
+class NotInSoftlet(Error):
+    """
+    This function must be called from a running softlet.
+    """
+
+class NotDone(Error):
+    """
+    The operation has not completed yet.
+    """
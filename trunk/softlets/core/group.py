@@ -0,0 +1,172 @@
+"""
+Several switchers running in their own OS threads.
+This is useful when softlets spend time in calls which release
+the GIL (I/O, some C extensions...).
+"""
+
+import sys
+import threading
+from threading import Thread
+
+from softlets.core.common import _set_threaded
+from softlets.core.switcher import Softlet, current_switcher
+
+__all__ = ['SwitcherGroup']
+
+
+class SwitcherGroup(object):
+    """
+    A group of switchers, each running in its own OS thread.
+    Softlets are spawned onto a given switcher or onto the least
+    loaded one, and idle switchers steal runnable softlets from busy
+    ones. Only standalone softlets without children can be stolen.
+    WaitObjects shared between switchers must be protect()'ed: waking
+    up a softlet of another switcher goes through the async path.
+    """
+    # How often an idle switcher tries to steal work (in seconds)
+    steal_interval = 0.01
+
+    def __init__(self, nb_switchers):
+        """
+        Create a group of "nb_switchers" switchers and start their threads.
+        They wait for softlets until run() is called and all the softlets
+        of the group are finished.
+        """
+        # Softlets are spawned from the calling thread, even with
+        # a single switcher in the process
+        _set_threaded()
+        self.cond = threading.Condition(threading.Lock())
+        self.switchers = []
+        self.nb_softlets = 0
+        self.running = False
+        self.stopped = False
+        self.errors = []
+        self.threads = []
+        for i in xrange(nb_switchers):
+            thread = Thread(target=self._run_switcher,
+                name="softlets switcher thread %d" % i)
+            thread.setDaemon(True)
+            self.threads.append(thread)
+            thread.start()
+        try:
+            self.cond.acquire()
+            while len(self.switchers) < nb_switchers:
+                self.cond.wait()
+        finally:
+            self.cond.release()
+
+    def _run_switcher(self):
+        switcher = current_switcher()
+        switcher.group = self
+        switcher.hold()
+        try:
+            self.cond.acquire()
+            self.switchers.append(switcher)
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+        try:
+            try:
+                switcher.run()
+            except:
+                self.errors.append(sys.exc_info())
+                self.stop()
+        finally:
+            # The thread is about to exit
+            switcher.close()
+
+    def least_loaded(self):
+        """
+        Returns the switcher with the fewest softlets.
+        """
+        # Reading the other switchers' state without locking
+        # is fine for a hint
+        best = None
+        for switcher in self.switchers:
+            load = len(switcher.threads)
+            if best is None or load < best_load:
+                best, best_load = switcher, load
+        return best
+
+    def spawn(self, func, switcher=None, daemon=False):
+        """
+        Create a standalone Softlet from "func" (see Softlet) on
+        "switcher", or on the least loaded switcher of the group.
+        """
+        if switcher is None:
+            switcher = self.least_loaded()
+        return Softlet(func, standalone=True, daemon=daemon, switcher=switcher)
+
+    def steal(self, thief):
+        # Called from the thief's thread
+        # Ask the busiest switcher for half of its runnable softlets.
+        # Returns True if a request has been sent.
+        victim = None
+        best_load = 1
+        for switcher in self.switchers:
+            if switcher is thief:
+                continue
+            load = switcher.ready.count_waiters(switcher)
+            if load > best_load:
+                victim, best_load = switcher, load
+        if victim is None:
+            return False
+        def f():
+            victim.give_threads(thief, best_load // 2)
+        victim.push_async_call(f)
+        return True
+
+    def add_softlet(self):
+        # May be called from any thread
+        try:
+            self.cond.acquire()
+            self.nb_softlets += 1
+        finally:
+            self.cond.release()
+
+    def remove_softlet(self, n=1):
+        # May be called from any thread
+        try:
+            self.cond.acquire()
+            self.nb_softlets -= n
+            done = self.running and not self.nb_softlets
+        finally:
+            self.cond.release()
+        if done:
+            self.stop()
+
+    def stop(self):
+        """
+        Let the switchers exit once they have no softlets left.
+        """
+        try:
+            self.cond.acquire()
+            if self.stopped:
+                return
+            self.stopped = True
+        finally:
+            self.cond.release()
+        for switcher in self.switchers:
+            switcher.release()
+
+    def run(self):
+        """
+        Wait until all the (non-daemon) softlets of the group are
+        finished. Re-raises the first exception which has made
+        a switcher fail.
+        """
+        try:
+            self.cond.acquire()
+            self.running = True
+            done = not self.nb_softlets
+        finally:
+            self.cond.release()
+        if done:
+            self.stop()
+        for thread in self.threads:
+            # Not joining forever lets KeyboardInterrupt through
+            while thread.isAlive():
+                thread.join(0.1)
+        if self.errors:
+            exc_type, exc, tb = self.errors[0]
+            raise exc_type, exc, tb
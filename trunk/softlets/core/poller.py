@@ -0,0 +1,208 @@
+"""
+Pollers wait for file descriptors to become readable or writable.
+The best available implementation is exported as Poller:
+epoll, then poll, then select.
+All pollers are level-triggered, and report errors and hangups
+as both READ and WRITE events, so that the caller notices them
+when trying to read or write.
+"""
+
+import os
+import errno
+import fcntl
+import select
+
+__all__ = ['READ', 'WRITE', 'Poller', 'set_non_blocking']
+
+READ = 1
+WRITE = 2
+
+
+def set_non_blocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+def _interrupted(e):
+    # select.error is not an EnvironmentError in Python 2
+    return e.args and e.args[0] == errno.EINTR
+
+
+class SelectPoller(object):
+    """
+    Poller based on select(). Limited to FD_SETSIZE descriptors.
+    """
+    def __init__(self):
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, mask):
+        if mask & READ:
+            self.readers.add(fd)
+        if mask & WRITE:
+            self.writers.add(fd)
+
+    def modify(self, fd, mask):
+        self.unregister(fd)
+        self.register(fd, mask)
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+
+    def close(self):
+        pass
+
+    def poll(self, timeout=None):
+        """
+        Wait at most "timeout" seconds (forever if None) and
+        return a list of (fd, mask) tuples.
+        """
+        try:
+            r, w, x = select.select(self.readers, self.writers,
+                self.readers | self.writers, timeout)
+        except (select.error, EnvironmentError), e:
+            if _interrupted(e):
+                return []
+            raise
+        events = {}
+        for fd in r:
+            events[fd] = READ
+        for fd in w:
+            events[fd] = events.get(fd, 0) | WRITE
+        for fd in x:
+            events[fd] = READ | WRITE
+        return events.items()
+
+
+class PollPoller(object):
+    """
+    Poller based on poll().
+    """
+    def __init__(self):
+        self.poller = select.poll()
+        self.error = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+    def _events(self, mask):
+        events = 0
+        if mask & READ:
+            events |= select.POLLIN
+        if mask & WRITE:
+            events |= select.POLLOUT
+        return events
+
+    def register(self, fd, mask):
+        self.poller.register(fd, self._events(mask))
+
+    def modify(self, fd, mask):
+        self.poller.register(fd, self._events(mask))
+
+    def unregister(self, fd):
+        try:
+            self.poller.unregister(fd)
+        except KeyError:
+            pass
+
+    def close(self):
+        pass
+
+    def poll(self, timeout=None):
+        """
+        Wait at most "timeout" seconds (forever if None) and
+        return a list of (fd, mask) tuples.
+        """
+        if timeout is not None:
+            # poll() wants milliseconds, rounded up to avoid spinning
+            timeout = int(timeout * 1000.0 + 0.999)
+        try:
+            events = self.poller.poll(timeout)
+        except (select.error, EnvironmentError), e:
+            if _interrupted(e):
+                return []
+            raise
+        error = self.error
+        result = []
+        for fd, event in events:
+            mask = 0
+            if event & (select.POLLIN | error):
+                mask |= READ
+            if event & (select.POLLOUT | error):
+                mask |= WRITE
+            result.append((fd, mask))
+        return result
+
+
+class EpollPoller(object):
+    """
+    Poller based on epoll(), scales to many descriptors.
+    """
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def _events(self, mask):
+        events = 0
+        if mask & READ:
+            events |= select.EPOLLIN
+        if mask & WRITE:
+            events |= select.EPOLLOUT
+        return events
+
+    def register(self, fd, mask):
+        try:
+            self.epoll.register(fd, self._events(mask))
+        except IOError, e:
+            # The fd number may have been reused after being closed
+            # while registered
+            if e.errno != errno.EEXIST:
+                raise
+            self.epoll.modify(fd, self._events(mask))
+
+    def modify(self, fd, mask):
+        try:
+            self.epoll.modify(fd, self._events(mask))
+        except IOError, e:
+            # The fd may have been closed (hence unregistered) and reused
+            if e.errno != errno.ENOENT:
+                raise
+            self.epoll.register(fd, self._events(mask))
+
+    def unregister(self, fd):
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, ValueError):
+            # Already closed
+            pass
+
+    def close(self):
+        self.epoll.close()
+
+    def poll(self, timeout=None):
+        """
+        Wait at most "timeout" seconds (forever if None) and
+        return a list of (fd, mask) tuples.
+        """
+        if timeout is None:
+            timeout = -1
+        try:
+            events = self.epoll.poll(timeout)
+        except (select.error, EnvironmentError), e:
+            if _interrupted(e):
+                return []
+            raise
+        error = select.EPOLLERR | select.EPOLLHUP
+        result = []
+        for fd, event in events:
+            mask = 0
+            if event & (select.EPOLLIN | error):
+                mask |= READ
+            if event & (select.EPOLLOUT | error):
+                mask |= WRITE
+            result.append((fd, mask))
+        return result
+
+
+if hasattr(select, 'epoll'):
+    Poller = EpollPoller
+elif hasattr(select, 'poll'):
+    Poller = PollPoller
+else:
+    Poller = SelectPoller
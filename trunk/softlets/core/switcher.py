@@ -1,10 +1,16 @@
 
+import os
+import errno
 import threading
 from thread import get_ident
+from collections import deque
+from time import time as _time
 
 from softlets.core.common import *
 from softlets.core.errors import *
-from softlets.core.waitobject import WaitObject
+from softlets.core.waitobject import WaitObject, _take_from_deque
+from softlets.core.poller import Poller, READ, WRITE, set_non_blocking
+from softlets.util.timerqueue import TimerHeap, deadline
 
 #
 # Ready object
@@ -14,29 +20,89 @@ class _Ready(WaitObject):
     The Ready object is always ready.
     It is used implicitly when a thread is launched,
     or explicitly when a thread wants to temporarily
-    yield control without actually waiting on anything.
+    yield control without actually waiting on anything
+    (yield'ing None does the same).
+    Its waiters are all on its switcher, in the "threads" deque,
+    which the switcher uses directly.
     """
-    def __init__(self):
+    def __init__(self, switcher):
         WaitObject.__init__(self)
+        self.switcher = switcher
+        self.threads = deque()
         self.set_ready(True)
 
-# Special-casing Ready improves scalability with many threads
-Ready = _singleton(_Ready)
+    def get_waiter(self, switcher):
+        threads = self.threads
+        if not threads:
+            return None
+        waiter = threads.popleft()
+        if not threads:
+            switcher.remove_ready_object(self)
+        return waiter
+
+    def take_waiters(self, switcher, n, accept):
+        threads = self.threads
+        taken = _take_from_deque(threads, n, accept)
+        if taken and not threads:
+            switcher.remove_ready_object(self)
+        return taken
+
+    def count_waiters(self, switcher):
+        return len(self.threads)
+
+    def add_waiter(self, waiter):
+        switcher = waiter.switcher
+        if switcher is not self.switcher:
+            # The softlet has moved to another switcher since
+            # it got this object
+            switcher.ready.add_waiter(waiter)
+            return
+        threads = self.threads
+        if not threads:
+            switcher.add_ready_object(self)
+        threads.append(waiter)
+
+# Special-casing Ready improves scalability with many threads.
+# Each switcher has its own, so that its waiters aren't shared.
+def Ready():
+    """
+    Returns the Ready object of the current switcher.
+    """
+    return current_switcher().ready
+
+
+#
+# Sleeping object
+#
+class _Sleeping(WaitObject):
+    """
+    The object returned by sleep(). It is never ready: softlets
+    yield'ing it are not queued as its waiters, since they are
+    already parked on the switcher's timers.
+    """
+    def add_waiter(self, waiter):
+        pass
+
+_sleeping = _Sleeping()
 
 
 #
 # Softlet object
 #
+_no_children = frozenset()
 
 class Softlet(WaitObject):
     """
     A Softlet is an object that represents a cooperative thread.
     A Softlet is automatically registered to a specific switcher
     which handles the scheduling of all softlets attached to it.
-    (for now and by default, there is only one switcher)
+    (by default, the switcher of the current OS thread)
     """
+    __slots__ = ('standalone', 'switcher', 'children', 'daemon', 'parent',
+        'waiting_on', 'runner', 'finished', 'sleep_timer')
 
-    def __init__(self, func=None, standalone=False, daemon=False):
+    def __init__(self, func=None, standalone=False, daemon=False,
+            switcher=None):
         """
         Create Softlet from given generator, or from
         the overriden run() method if "func" is not specified.
@@ -44,19 +110,33 @@ class Softlet(WaitObject):
         when parent terminates.
         If "daemon" is True, Softlet is automatically killed
         when no non-daemon Softlets are left.
+        If "switcher" is given, the Softlet is attached to it instead
+        of the current switcher. If it runs in another OS thread, the
+        Softlet is standalone.
         """
         WaitObject.__init__(self)
+        if switcher is None:
+            switcher = current_switcher()
+        elif _threaded[0] and switcher.tid != get_ident():
+            standalone = True
         self.standalone = standalone
-        self.switcher = current_switcher()
-        self.children = set()
+        self.switcher = switcher
+        # Shared and empty until the first child is added
+        self.children = _no_children
         self.daemon = daemon
         if not standalone:
-            self.parent = self.switcher.current_thread
-            if self.parent:
-                self.parent.children.add(self)
+            parent = self.switcher.current_thread
+            self.parent = parent
+            if parent:
+                if parent.children is _no_children:
+                    parent.children = set([self])
+                else:
+                    parent.children.add(self)
         else:
             self.parent = None
         self.waiting_on = None
+        # Switcher timer of a pending sleep()
+        self.sleep_timer = None
         self.start(func)
 
     def start(self, func=None):
@@ -65,19 +145,47 @@ class Softlet(WaitObject):
         self.set_ready(False)
         self.switcher.add_thread(self)
 
+    def wake(self):
+        """
+        Wake up the softlet at the end of a sleep().
+        """
+        self.sleep_timer = None
+        if not self.finished and self.waiting_on is _sleeping:
+            wait_object = self.switcher.ready
+            wait_object.add_waiter(self)
+            self.waiting_on = wait_object
+
     def terminate(self):
-        self.finished = True
-        self.set_ready(True)
-        self.switcher.remove_thread(self)
+        """
+        Terminate the softlet, and its children (recursively)
+        unless they are standalone.
+        """
+        if self.finished:
+            return
         if self.parent:
             self.parent.children.remove(self)
-        while True:
-            try:
-                child = iter(self.children).next()
-            except StopIteration:
-                break
-            else:
-                child.terminate()
+        # Walk the subtree without recursing, detaching the children
+        subtree = []
+        stack = [self]
+        while stack:
+            thread = stack.pop()
+            subtree.append(thread)
+            children = thread.children
+            if children:
+                stack.extend(children)
+                thread.children = _no_children
+        # Everything is finished before waking anyone, in case
+        # a readiness callback terminates one of them again
+        for thread in subtree:
+            thread.finished = True
+            timer = thread.sleep_timer
+            if timer is not None:
+                # Don't keep the softlet alive until the timer expires
+                thread.sleep_timer = None
+                thread.switcher.remove_timer(timer)
+        self.switcher.remove_threads(subtree)
+        for thread in subtree:
+            thread.set_ready(True)
 
 
 #
@@ -92,33 +200,268 @@ class Switcher(object):
     """
     The main switching loop. Handles WaitObjects and Softlets.
     """
+    # Whether a switcher has already been created in this process
+    created = False
 
-    def __init__(self):
+    def __init__(self, batch_size=1):
+        """
+        Create a switcher. "batch_size" is the maximum number of
+        softlets stepped in one scheduling pass, i.e. between two
+        checks for async calls. In each pass, every softlet which was
+        runnable at the beginning of the pass is stepped at most once.
+        """
+        if Switcher.created:
+            # Several switchers, several OS threads
+            _set_threaded()
+        Switcher.created = True
         self.threads = set()
+        # Ready objects with at least one waiter on this switcher
         self.ready_objects = set()
+        # FIFO of ready objects, in the order they will be scheduled.
+        # Entries are not removed when an object stops being ready,
+        # they are skipped when popped instead.
+        self.run_queue = deque()
+        self.queued_objects = set()
+        self.batch_size = batch_size
+        self.ready = _Ready(self)
         self.nb_switches = 0
         self.nb_daemons = 0
         self.current_thread = None
-        # Async signalling (objects waken out of the switcher thread)
+        # Async signalling (objects waken out of the switcher thread):
+        # other threads append readiness records and calls to these
+        # deques without locking (see run_async_calls())
         self.tid = get_ident()
         self.nb_async_waits = 0
-        self.async_cond = threading.Condition(threading.Lock())
-        self.async_calls = []
+        self.nb_async_calls = 0
+        self.nb_async_records = 0
+        self.async_records = deque()
+        self.async_calls = deque()
+        # Timers run by the switcher itself (see enable_timers())
+        self.timers = None
+        self.timer_deadline = None
+        self.expired_timers = deque()
+        # File descriptors waited upon (see watch_fd()): the poller is
+        # also used for waiting idly, interrupted through a self-pipe
+        # when an async record or call is pushed
+        self.poller = Poller()
+        self.fd_watches = {READ: {}, WRITE: {}}
+        self.fd_masks = {}
+        self.nb_fd_waits = 0
+        self.polling = False
+        self.wakeup_pending = False
+        # The self-pipe is only created when the switcher first runs
+        self.wakeup_r = self.wakeup_w = None
+        # Multi-switcher support (see SwitcherGroup): a held switcher
+        # keeps running (waiting for softlets) even if it has none
+        self.group = None
+        self.held = 0
+        self.steal_pending = False
+
+    def enable_timers(self, timers=None):
+        """
+        Let the switcher handle timers itself instead of delegating
+        them to a helper thread: timers are expired in-thread, and the
+        next deadline is used as a timeout when waiting idly.
+        "timers" is the data structure holding pending timers
+        (see softlets.util.timerqueue), by default a TimerHeap.
+        Timer objects created afterwards will use it. If the switcher
+        already handles timers, pending timers are transferred.
+        """
+        if timers is None:
+            timers = TimerHeap()
+        if self.timers is not None:
+            for timer in self.timers.entries():
+                timers.add(timer)
+        self.timers = timers
+        self.timer_deadline = timers.next_deadline()
+
+    def add_timer(self, delay, func, slack=0.0):
+        # Called in-thread
+        timestamp = deadline(delay, slack)
+        timer = (timestamp, func)
+        self.timers.add(timer)
+        if self.timer_deadline is None or timestamp < self.timer_deadline:
+            self.timer_deadline = timestamp
+        return timer
+
+    def remove_timer(self, timer):
+        # Called in-thread
+        try:
+            self.timers.remove(timer)
+        except ValueError:
+            # Maybe it has expired but not been called yet
+            try:
+                self.expired_timers.remove(timer)
+            except ValueError:
+                raise ValueError("cannot remove unknown timer '%s'" % str(timer))
 
-    def add_thread(self, thread):
+    def run_timers(self):
         # Called in-thread
-        wait_object = Ready()
+        expired = self.expired_timers
+        expired.extend(self.timers.pop_expired(_time()))
+        while expired:
+            expired.popleft()[1]()
+        self.timer_deadline = self.timers.next_deadline()
+
+    def watch_fd(self, wait_object):
+        # Called in-thread
+        # Make "wait_object" ready when its fd has the event it waits
+        # for. This is one-shot: the watch must be renewed after that.
+        fd, event = wait_object.fd, wait_object.event
+        watches = self.fd_watches[event]
+        if fd not in watches:
+            self.nb_fd_waits += 1
+        watches[fd] = wait_object
+        mask = self.fd_masks.get(fd, 0)
+        if not mask & event:
+            self.set_fd_mask(fd, mask | event)
+
+    def unwatch_fd(self, wait_object):
+        # Called in-thread
+        fd, event = wait_object.fd, wait_object.event
+        watches = self.fd_watches[event]
+        if watches.get(fd) is wait_object:
+            del watches[fd]
+            self.nb_fd_waits -= 1
+        mask = self.fd_masks.get(fd, 0)
+        if mask & event:
+            self.set_fd_mask(fd, mask & ~event)
+
+    def set_fd_mask(self, fd, mask):
+        # Called in-thread
+        old_mask = self.fd_masks.get(fd, 0)
+        if not mask:
+            del self.fd_masks[fd]
+            self.poller.unregister(fd)
+        elif not old_mask:
+            self.fd_masks[fd] = mask
+            self.poller.register(fd, mask)
+        else:
+            self.fd_masks[fd] = mask
+            self.poller.modify(fd, mask)
+
+    def poll_fds(self, timeout):
+        # Called in-thread
+        # Wait at most "timeout" seconds for fd events (forever if None)
+        events = self.poller.poll(timeout)
+        fd_masks = self.fd_masks
+        readers = self.fd_watches[READ]
+        writers = self.fd_watches[WRITE]
+        wakeup_r = self.wakeup_r
+        for fd, event in events:
+            if fd == wakeup_r:
+                # Clear the flag, then consume the single byte written
+                # when it was set: a wakeup racing with us writes another
+                # byte, which must stay for the next poll to report
+                self.wakeup_pending = False
+                try:
+                    os.read(wakeup_r, 1)
+                except OSError, e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                continue
+            mask = fd_masks.get(fd, 0)
+            event &= mask
+            if not event:
+                continue
+            # Events nobody waits for anymore are unregistered lazily,
+            # since watches are usually renewed right after firing
+            unwanted = 0
+            if event & READ:
+                wait_object = readers.pop(fd, None)
+                if wait_object is None:
+                    unwanted |= READ
+                else:
+                    self.nb_fd_waits -= 1
+                    wait_object.set_ready(True)
+            if event & WRITE:
+                wait_object = writers.pop(fd, None)
+                if wait_object is None:
+                    unwanted |= WRITE
+                else:
+                    self.nb_fd_waits -= 1
+                    wait_object.set_ready(True)
+            if unwanted:
+                self.set_fd_mask(fd, mask & ~unwanted)
+
+    def add_thread(self, thread, counted=False):
+        # May be called async (out-of-thread)
+        group = self.group
+        if _threaded[0] and get_ident() != self.tid:
+            if group is not None and not thread.daemon:
+                # Count it right away, so that the group doesn't stop
+                # before the softlet is actually added
+                group.add_softlet()
+            def f():
+                self.add_thread(thread, True)
+            self.push_async_call(f)
+            return
+        wait_object = self.ready
         wait_object.add_waiter(thread)
         thread.waiting_on = wait_object
         self.threads.add(thread)
         if thread.daemon:
             self.nb_daemons += 1
+        elif group is not None and not counted:
+            group.add_softlet()
 
-    def remove_thread(self, thread):
+    def remove_threads(self, threads):
         # Called in-thread
-        self.threads.remove(thread)
-        if thread.daemon:
-            self.nb_daemons -= 1
+        self.threads.difference_update(threads)
+        nb_daemons = 0
+        for thread in threads:
+            if thread.daemon:
+                nb_daemons += 1
+        self.nb_daemons -= nb_daemons
+        n = len(threads) - nb_daemons
+        if n and self.group is not None:
+            self.group.remove_softlet(n)
+
+    def hold(self):
+        # Called in-thread
+        self.held += 1
+
+    def release(self):
+        # May be called async (out-of-thread)
+        if _threaded[0] and get_ident() != self.tid:
+            self.push_async_call(self.release)
+            return
+        self.held -= 1
+
+    def give_threads(self, thief, n):
+        # Called in-thread
+        # Hand over up to "n" runnable softlets to another switcher.
+        # Only standalone softlets without children can be moved,
+        # since parents and children are touched without locking.
+        def movable(thread):
+            return (not thread.finished and thread.parent is None
+                and not thread.children)
+        threads = self.ready.take_waiters(self, n, movable)
+        for thread in threads:
+            self.threads.remove(thread)
+            if thread.daemon:
+                self.nb_daemons -= 1
+            thread.switcher = thief
+            thread.waiting_on = None
+        # Always answer, even with nothing, so that the thief
+        # can ask again
+        thief.adopt_threads(threads)
+
+    def adopt_threads(self, threads):
+        # May be called async (out-of-thread)
+        if _threaded[0] and get_ident() != self.tid:
+            def f():
+                self.adopt_threads(threads)
+            self.push_async_call(f)
+            return
+        self.steal_pending = False
+        wait_object = self.ready
+        for thread in threads:
+            wait_object.add_waiter(thread)
+            thread.waiting_on = wait_object
+            self.threads.add(thread)
+            if thread.daemon:
+                self.nb_daemons += 1
 
     def add_async_wait(self, wait_object):
         # Called in-thread
@@ -130,22 +473,27 @@ class Switcher(object):
 
     def set_ready(self, wait_object, ready):
         # May be called async (out-of-thread)
-        async = (get_ident() != self.tid)
-        if async:
-            def f():
-                self.set_ready(wait_object, ready)
-            self.push_async_call(f)
-            return
+        if _threaded[0] and get_ident() != self.tid:
+            batch = getattr(_async_batch, 'changes', None)
+            if batch is not None:
+                try:
+                    batch[self].append((wait_object, ready))
+                except KeyError:
+                    batch[self] = [(wait_object, ready)]
+                return
+            self.async_records.append((wait_object, ready))
+            self.wakeup()
+        elif ready:
+            self.add_ready_object(wait_object)
         else:
-            # In-thread
-            if ready:
-                self.ready_objects.add(wait_object)
-            else:
-                self.ready_objects.discard(wait_object)
+            self.ready_objects.discard(wait_object)
 
     def add_ready_object(self, wait_object):
         # Called in-thread
         self.ready_objects.add(wait_object)
+        if wait_object not in self.queued_objects:
+            self.queued_objects.add(wait_object)
+            self.run_queue.append(wait_object)
 
     def remove_ready_object(self, wait_object):
         # Called in-thread
@@ -153,70 +501,226 @@ class Switcher(object):
 
     def push_async_call(self, func):
         # Called out-of-thread
-        self.async_cond.acquire()
         self.async_calls.append(func)
-        self.async_cond.notify()
-        self.async_cond.release()
+        self.wakeup()
+
+    def push_async_records(self, records):
+        # Called out-of-thread
+        # "records" is a list of (wait_object, ready) tuples
+        self.async_records.extend(records)
+        self.wakeup()
+
+    def wakeup(self):
+        # Called out-of-thread
+        # Interrupt the switcher's idle wait. The switcher sets "polling"
+        # before looking at its deques one last time, so either it sees
+        # what has just been appended, or we see it polling. Only one byte
+        # is written until the switcher drains the pipe.
+        if self.polling and not self.wakeup_pending:
+            self.wakeup_pending = True
+            try:
+                os.write(self.wakeup_w, 'x')
+            except OSError, e:
+                if e.errno != errno.EAGAIN:
+                    raise
 
     def run_async_calls(self):
-        # Called in-thread while locked
-        for fun in self.async_calls:
-            fun()
-        del self.async_calls[:]
+        # Called in-thread
+        # The deques are drained with popleft() instead of being swapped
+        # for new ones: another thread may have fetched the old deque just
+        # before the swap, and would append to it afterwards. Only the
+        # entries present on entry are taken, so that other threads can't
+        # keep the switcher busy here.
+        records = self.async_records
+        n = len(records)
+        if n:
+            self.nb_async_records += n
+            popleft = records.popleft
+            if n == 1:
+                changes = [popleft()]
+            else:
+                # Coalesce records: only the last state of each object
+                # matters, objects are handled in order of first arrival
+                latest = {}
+                changes = []
+                for i in xrange(n):
+                    wait_object, ready = popleft()
+                    if wait_object not in latest:
+                        changes.append(wait_object)
+                    latest[wait_object] = ready
+                changes = [(w, latest[w]) for w in changes]
+            ready_objects = self.ready_objects
+            for wait_object, ready in changes:
+                if ready:
+                    self.add_ready_object(wait_object)
+                else:
+                    ready_objects.discard(wait_object)
+        calls = self.async_calls
+        n = len(calls)
+        if n:
+            self.nb_async_calls += n
+            popleft = calls.popleft
+            for i in xrange(n):
+                popleft()()
+
+    def close(self):
+        """
+        Release the file descriptors of the switcher (its self-pipe
+        and poller). The switcher can't be run anymore afterwards.
+        """
+        # Not unregistering anything: after fork, the poller may
+        # still be shared with the parent
+        if self.wakeup_r is not None:
+            os.close(self.wakeup_r)
+            os.close(self.wakeup_w)
+            self.wakeup_r = self.wakeup_w = None
+        self.poller.close()
 
     def run(self):
-        A, R = (self.async_cond.acquire, self.async_cond.release)
-        while len(self.threads) > self.nb_daemons:
-            # Process pending async calls
-            if self.async_calls:
-                try:
-                    A()
-                    self.run_async_calls()
-                finally:
-                    R()
-            # This loop is a fake: we always break because
-            # thread calls inside the loop can change the set size
-            for r in self.ready_objects:
-                # Give control to a thread
-                thread = r.get_waiter(self)
-                if thread is None or thread.finished:
+        # The switcher may have been created in another OS thread
+        self.tid = get_ident()
+        if self.wakeup_r is None:
+            self.wakeup_r, self.wakeup_w = os.pipe()
+            set_non_blocking(self.wakeup_r)
+            set_non_blocking(self.wakeup_w)
+            self.poller.register(self.wakeup_r, READ)
+        async_records = self.async_records
+        async_calls = self.async_calls
+        run_queue = self.run_queue
+        ready_objects = self.ready_objects
+        queued_objects = self.queued_objects
+        ready = self.ready
+        ready_threads = ready.threads
+        # Value of nb_switches when fds should be polled again
+        next_poll = 0
+        while len(self.threads) > self.nb_daemons or self.held:
+            # Process pending async records and calls
+            if async_records or async_calls:
+                self.run_async_calls()
+            # Expire in-thread timers
+            deadline = self.timer_deadline
+            if deadline is not None and deadline <= _time():
+                self.run_timers()
+            if not ready_objects:
+                if len(self.threads) <= self.nb_daemons and not self.held:
+                    # An async call has just released the switcher
+                    # (e.g. SwitcherGroup.stop())
                     break
-                self.nb_switches += 1
-                try:
-                    self.current_thread = thread
-                    wait_object = thread.runner.next()
-                except Exception, e:
-                    self.current_thread = None
-                    thread.terminate()
-                    if not isinstance(e, StopIteration):
-                        raise
-                else:
-                    self.current_thread = None
-                    wait_object.add_waiter(thread)
-                    thread.waiting_on = wait_object
-                break
-            else:
-                # self.ready_objects is empty
-                async = self.nb_async_waits > 0
-                if not async:
+                deadline = self.timer_deadline
+                async = (self.nb_async_waits > 0 or self.nb_fd_waits > 0
+                    or self.held > 0)
+                if not async and deadline is None:
                     raise Starvation()
-                try:
-                    A()
-                    self.async_cond.wait()
-                    self.run_async_calls()
-                finally:
-                    R()
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0.0, deadline - _time())
+                group = self.group
+                if group is not None:
+                    # Idle: try to steal work from busier switchers,
+                    # and try again later if there was nothing to steal
+                    if not self.steal_pending:
+                        self.steal_pending = group.steal(self)
+                    if timeout is None or timeout > group.steal_interval:
+                        timeout = group.steal_interval
+                self.polling = True
+                # Async records or calls may have been pushed since we
+                # last looked
+                if async_records or async_calls:
+                    timeout = 0.0
+                self.poll_fds(timeout)
+                self.polling = False
+                self.run_async_calls()
+                next_poll = self.nb_switches + len(run_queue)
+                continue
+            if self.nb_fd_waits and self.nb_switches >= next_poll:
+                # Don't starve fd waits while other softlets are runnable,
+                # but poll only once per round of the run queue
+                self.poll_fds(0.0)
+                next_poll = self.nb_switches + len(run_queue)
+            # Scheduling pass: take the objects currently queued in FIFO
+            # order and step their waiters, up to batch_size softlets.
+            # Waiters added during the pass (e.g. a softlet yielding Ready
+            # again) are behind the snapshot and wait for the next pass.
+            budget = self.batch_size
+            for i in xrange(len(run_queue)):
+                r = run_queue.popleft()
+                if r not in ready_objects:
+                    # Stale entry
+                    queued_objects.remove(r)
+                    continue
+                # Queue it again at the end right away, in case it still
+                # has other waiters after this pass
+                run_queue.append(r)
+                if budget > 1:
+                    nb_waiters = min(r.count_waiters(self), budget)
+                else:
+                    nb_waiters = 1
+                budget -= nb_waiters
+                while nb_waiters:
+                    nb_waiters -= 1
+                    # Give control to a thread. Softlets yield'ing Ready
+                    # (or None) are handled here directly.
+                    if r is ready:
+                        thread = ready_threads.popleft()
+                        if not ready_threads:
+                            ready_objects.remove(ready)
+                    else:
+                        thread = r.get_waiter(self)
+                    if thread is None or thread.finished:
+                        continue
+                    self.nb_switches += 1
+                    try:
+                        self.current_thread = thread
+                        wait_object = thread.runner.next()
+                    except Exception, e:
+                        self.current_thread = None
+                        thread.terminate()
+                        if not isinstance(e, StopIteration):
+                            raise
+                    else:
+                        self.current_thread = None
+                        if wait_object is None or wait_object is ready:
+                            if not ready_threads:
+                                self.add_ready_object(ready)
+                            ready_threads.append(thread)
+                            thread.waiting_on = ready
+                        else:
+                            wait_object.add_waiter(thread)
+                            thread.waiting_on = wait_object
+                    if r not in ready_objects:
+                        break
+                if not budget:
+                    break
 
 
 #
 # Functions
 #
 
-current_switcher = _singleton(Switcher)
+current_switcher = _local_singleton(Switcher)
 current_switcher.__doc__ = """
-Returns the switcher currently in use.
+Returns the switcher of the current OS thread
+(it is created on first use).
 """
 
+def set_single_threaded():
+    """
+    Promise that no other OS thread will interact with softlets (no
+    set_ready() on unprotected objects, no Softlet creation...), so
+    that switchers skip the checks for out-of-thread calls.
+    The promise is withdrawn automatically when a WaitObject is
+    protect()'ed or a second switcher is created, or by calling
+    set_threaded().
+    """
+    _set_single_threaded()
+
+def set_threaded():
+    """
+    Tell the switchers that other OS threads may interact with them
+    (the default, see set_single_threaded()).
+    """
+    _set_threaded()
+
 def current_softlet():
     """
     Returns the currently running softlet,
@@ -224,9 +728,63 @@ def current_softlet():
     """
     return current_switcher().current_thread
 
-def main_loop(switcher=None):
+#
+# Batching of out-of-thread readiness changes
+#
+_async_batch = threading.local()
+
+def begin_async_batch():
+    """
+    Start batching the readiness changes made by the calling
+    (non-switcher) thread, until end_async_batch() is called.
+    Batches can be nested.
+    """
+    depth = getattr(_async_batch, 'depth', 0)
+    if not depth:
+        _async_batch.changes = {}
+    _async_batch.depth = depth + 1
+
+def end_async_batch():
+    """
+    Deliver the readiness changes batched since begin_async_batch()
+    to each switcher, with a single wakeup.
+    """
+    _async_batch.depth -= 1
+    if _async_batch.depth:
+        return
+    batch = _async_batch.changes
+    _async_batch.changes = None
+    for switcher, changes in batch.items():
+        switcher.push_async_records(changes)
+
+def sleep(delay):
+    """
+    Returns a WaitObject to yield for sleeping "delay" seconds:
+        yield softlets.sleep(delay)
+    This is cheaper than yield'ing a Timer, since the current softlet
+    is directly parked on the switcher's timers (which are enabled if
+    needed, see Switcher.enable_timers()). The returned object should
+    not be combined with other WaitObjects.
+    """
+    switcher = current_switcher()
+    thread = switcher.current_thread
+    if thread is None:
+        raise NotInSoftlet()
+    if switcher.timers is None:
+        switcher.enable_timers()
+    if thread.sleep_timer is not None:
+        # A previous sleep() result hasn't been yielded: it must not
+        # wake up this sleep
+        switcher.remove_timer(thread.sleep_timer)
+    thread.sleep_timer = switcher.add_timer(delay, thread.wake)
+    return _sleeping
+
+def main_loop(switcher=None, batch_size=None):
     """
     Runs the softlets main loop.
+    If "batch_size" is given, it overrides the switcher's batch size.
     """
     switcher = switcher or current_switcher()
+    if batch_size is not None:
+        switcher.batch_size = batch_size
     switcher.run()
@@ -4,6 +4,10 @@ from collections import deque
 from softlets.core.common import *
 
 
+# Shared empty containers, replaced on first use. Never modify them.
+_no_waiters = {}
+_no_callbacks = ()
+
 #
 # Different kinds of objects providing a simple synchronization scheme
 #
@@ -12,21 +16,42 @@ class WaitObject(object):
     """
     A WaitObject is an object a softlet can wait on by yield'ing it.
     """
+    __slots__ = ('_wswitcher', '_waiter', '_more', '_waiters',
+        '_readiness_callbacks', '_armed', 'ready', 'is_async',
+        '_protect_lock')
+    # Whether the methods are serialized by a lock (see protect())
+    _protected = False
 
     def __init__(self):
-        # Waiters are keyed by their respective switcher
-        self._waiters = {}
-        self._readiness_callbacks = []
+        # Almost always, all the waiters are on the same switcher,
+        # _wswitcher. A single waiter is kept in _waiter, several ones
+        # in the _more deque (which is kept once allocated). Otherwise,
+        # the _waiters dict maps switchers to deques of waiters.
+        self._wswitcher = None
+        self._waiter = None
+        self._more = None
+        self._waiters = _no_waiters
+        self._readiness_callbacks = _no_callbacks
         self._armed = False
         self.ready = False
         self.is_async = False
 
     def protect(self, lock=None):
-        lock = lock or _lock
-        self.get_waiter = _protect(self.get_waiter, lock)
-        self.add_waiter = _protect(self.add_waiter, lock)
-        self.set_ready = _protect(self.set_ready, lock)
-        self.notify_readiness = _protect(self.notify_readiness, lock)
+        """
+        Make the WaitObject usable from several threads, by serializing
+        its methods with "lock" (by default, a lock from a striped table
+        shared with a few unrelated objects).
+        Objects whose readiness callbacks use other protected objects
+        (e.g. a LogicalOr between them) should be given the same lock,
+        otherwise locks could be taken in different orders.
+        """
+        _set_threaded()
+        if self._protected:
+            return
+        self._protect_lock = lock or _stripe_lock(self)
+        # Instances have no __dict__ to hold wrapped methods,
+        # switch to a subclass with locked methods instead
+        self.__class__ = _protected_class(self.__class__)
 
     def arm(self):
         """
@@ -41,18 +66,81 @@ class WaitObject(object):
         Get one of the softlets waiting upon this WaitObject,
         depending on the switcher.
         """
+        if self._wswitcher is switcher:
+            more = self._more
+            if more:
+                waiter = more.popleft()
+                if more:
+                    return waiter
+            else:
+                waiter = self._waiter
+                self._waiter = None
+            self._wswitcher = None
+            switcher.remove_ready_object(self)
+            if self.is_async:
+                switcher.remove_async_wait(self)
+            return waiter
+        waiters = self._waiters
         try:
-            q = self._waiters[switcher]
+            q = waiters[switcher]
         except KeyError:
             return None
         waiter = q.popleft()
         if not q:
-            del self._waiters[switcher]
+            del waiters[switcher]
+            if not waiters:
+                self._waiters = _no_waiters
             switcher.remove_ready_object(self)
             if self.is_async:
                 switcher.remove_async_wait(self)
         return waiter
 
+    def take_waiters(self, switcher, n, accept):
+        """
+        Remove and return up to "n" of the softlets waiting upon this
+        WaitObject, depending on the switcher, for which accept(softlet)
+        is true. Softlets are taken from the end of the queue.
+        """
+        single = self._wswitcher is switcher
+        if single:
+            if self._waiter is not None:
+                self._more = deque([self._waiter])
+                self._waiter = None
+            q = self._more
+        else:
+            try:
+                q = self._waiters[switcher]
+            except KeyError:
+                return []
+        taken = _take_from_deque(q, n, accept)
+        if not q:
+            if single:
+                self._wswitcher = None
+            else:
+                del self._waiters[switcher]
+                if not self._waiters:
+                    self._waiters = _no_waiters
+            if self.ready:
+                switcher.remove_ready_object(self)
+            if self.is_async:
+                switcher.remove_async_wait(self)
+        return taken
+
+    def count_waiters(self, switcher):
+        """
+        Get the number of softlets waiting upon this WaitObject,
+        depending on the switcher.
+        """
+        if self._wswitcher is switcher:
+            more = self._more
+            if more:
+                return len(more)
+            return 1
+        try:
+            return len(self._waiters[switcher])
+        except KeyError:
+            return 0
+
     def add_waiter(self, waiter):
         """
         Add a softlet waiting upon this WaitObject.
@@ -61,14 +149,42 @@ class WaitObject(object):
             self.arm()
             self._armed = True
         switcher = waiter.switcher
-        try:
-            self._waiters[switcher].append(waiter)
-        except KeyError:
-            self._waiters[switcher] = deque([waiter])
-            if self.ready:
-                switcher.add_ready_object(self)
-            if self.is_async:
-                switcher.add_async_wait(self)
+        wswitcher = self._wswitcher
+        if wswitcher is switcher:
+            more = self._more
+            if more is None:
+                more = self._more = deque()
+            if self._waiter is not None:
+                more.append(self._waiter)
+                self._waiter = None
+            more.append(waiter)
+            return
+        waiters = self._waiters
+        if wswitcher is None and waiters is _no_waiters:
+            # First waiter
+            self._wswitcher = switcher
+            self._waiter = waiter
+        else:
+            if waiters is _no_waiters:
+                # Waiters from a second switcher: move all the waiters
+                # to the dict
+                waiters = self._waiters = {}
+                if self._waiter is not None:
+                    waiters[wswitcher] = deque([self._waiter])
+                else:
+                    waiters[wswitcher] = self._more
+                self._waiter = None
+                self._more = None
+                self._wswitcher = None
+            try:
+                waiters[switcher].append(waiter)
+                return
+            except KeyError:
+                waiters[switcher] = deque([waiter])
+        if self.ready:
+            switcher.add_ready_object(self)
+        if self.is_async:
+            switcher.add_async_wait(self)
 
     def set_ready(self, ready):
         """
@@ -79,6 +195,8 @@ class WaitObject(object):
             self.ready = ready
             for callback in self._readiness_callbacks:
                 callback(self, ready)
+            if self._wswitcher is not None:
+                self._wswitcher.set_ready(self, ready)
             for switcher in self._waiters:
                 switcher.set_ready(self, ready)
 
@@ -91,7 +209,10 @@ class WaitObject(object):
         if not self._armed:
             self.arm()
             self._armed = True
-        self._readiness_callbacks.append(callback)
+        if self._readiness_callbacks is _no_callbacks:
+            self._readiness_callbacks = [callback]
+        else:
+            self._readiness_callbacks.append(callback)
         if self.ready:
             callback(self, True)
 
@@ -120,6 +241,55 @@ class WaitObject(object):
         return LogicalNot(self)
 
 
+def _take_from_deque(q, n, accept):
+    # Remove and return up to "n" items of the deque for which
+    # accept(item) is true, taken from the end
+    taken = []
+    kept = []
+    # Don't scan the whole queue for a few items
+    nb_scans = 2 * n + 16
+    while q and len(taken) < n and nb_scans:
+        nb_scans -= 1
+        item = q.pop()
+        if accept(item):
+            taken.append(item)
+        else:
+            kept.append(item)
+    kept.reverse()
+    q.extend(kept)
+    return taken
+
+
+# Protected variants of WaitObject classes (see WaitObject.protect())
+_protected_classes = {}
+_protected_methods = ('get_waiter', 'take_waiters', 'add_waiter',
+    'set_ready', 'notify_readiness')
+
+def _locked(func):
+    def method(self, *args, **kargs):
+        lock = self._protect_lock
+        try:
+            lock.acquire()
+            return func(self, *args, **kargs)
+        finally:
+            lock.release()
+    method.__doc__ = func.__doc__
+    method.__name__ = func.__name__
+    return method
+
+def _protected_class(cls):
+    try:
+        return _protected_classes[cls]
+    except KeyError:
+        pass
+    d = {'__slots__': (), '__module__': cls.__module__, '_protected': True}
+    for name in _protected_methods:
+        d[name] = _locked(getattr(cls, name).im_func)
+    protected = type(cls.__name__, (cls,), d)
+    _protected_classes[cls] = protected
+    return protected
+
+
 class LogicalNot(WaitObject):
     """
     Logical negation of a WaitObject.
@@ -220,3 +390,242 @@ class LogicalAnd(MultipleWaitObject):
     def __rand__(self, b):
         return self.__and__(b)
 
+
+
+#
+# Flattened logical expressions
+#
+
+class _Node(object):
+    """
+    An any/all node of a LogicalExpression. It is true when at least
+    "threshold" of its inputs are true: 1 for an any node, all of them
+    for an all node.
+    """
+    __slots__ = ('parent', 'is_any', 'nb_inputs', 'count', 'threshold',
+        'value')
+
+    def __init__(self, parent, is_any):
+        self.parent = parent
+        self.is_any = is_any
+        self.nb_inputs = 0
+        # Number of true inputs
+        self.count = 0
+        self.threshold = 0
+        self.value = False
+
+
+class _Leaf(object):
+    """
+    An occurrence of a WaitObject in a LogicalExpression.
+    It is true when the object is ready (not ready if inverted).
+    """
+    __slots__ = ('expression', 'obj', 'node', 'inverted', 'value', 'queued')
+
+    def __init__(self, expression, obj, node, inverted):
+        self.expression = expression
+        self.obj = obj
+        self.node = node
+        self.inverted = inverted
+        self.value = False
+        # Whether it is in the expression's queue of true leaves
+        self.queued = False
+
+    def on_object_ready(self, obj, ready):
+        value = ready != self.inverted
+        if value != self.value:
+            self.value = value
+            expression = self.expression
+            if value and not self.queued:
+                self.queued = True
+                expression.true_leaves.append(self)
+            expression._update(self.node, value and 1 or -1)
+
+
+class _Group(object):
+    """
+    The flattened form of an any/all expression: its inputs are
+    (obj, inverted) pairs, obj being a WaitObject or a _Group of the
+    other kind. Groups are never modified once built, so they are
+    shared between expressions.
+    """
+    __slots__ = ('is_any', 'inputs')
+
+    def __init__(self, is_any):
+        self.is_any = is_any
+        self.inputs = []
+
+
+def _build_group(is_any, items):
+    # Flatten the (obj, inverted) items into a _Group, without recursing
+    root = _Group(is_any)
+    items = list(items)
+    items.reverse()
+    frames = [(root, items)]
+    while frames:
+        group, pending = frames[-1]
+        if not pending:
+            frames.pop()
+            continue
+        obj, inverted = pending.pop()
+        while isinstance(obj, LogicalNot):
+            obj = obj.obj
+            inverted = not inverted
+        if isinstance(obj, LogicalExpression):
+            obj = obj.group
+        if isinstance(obj, _Group):
+            if (obj.is_any != inverted) == group.is_any:
+                # Same kind once negated: reuse its flattened inputs
+                if inverted:
+                    group.inputs.extend([(o, not i) for o, i in obj.inputs])
+                else:
+                    group.inputs.extend(obj.inputs)
+            else:
+                group.inputs.append((obj, inverted))
+        elif isinstance(obj, (LogicalOr, LogicalAnd)):
+            sub_is_any = isinstance(obj, LogicalOr) != inverted
+            children = [(o, inverted) for o in reversed(obj.objs)]
+            if sub_is_any == group.is_any:
+                pending.extend(children)
+            else:
+                sub = _Group(sub_is_any)
+                group.inputs.append((sub, False))
+                frames.append((sub, children))
+        else:
+            group.inputs.append((obj, inverted))
+    return root
+
+
+class LogicalExpression(WaitObject):
+    """
+    A logical expression between WaitObjects, compiled into a single
+    object. Nested expressions, LogicalOr, LogicalAnd and LogicalNot
+    objects are flattened (negations being pushed down to the objects),
+    and once the expression is armed, readiness is tracked by a tree
+    of counters: a readiness change of one of the objects costs O(1)
+    whatever their number.
+    Use any_of() and all_of() to build it.
+    """
+    def __init__(self, is_any, items):
+        """
+        "items" are (obj, inverted) pairs.
+        """
+        WaitObject.__init__(self)
+        self.group = _build_group(is_any, items)
+        self.leaves = []
+        self.root = None
+        # Leaves which have become true, the ones which aren't true
+        # anymore are removed lazily by get()
+        self.true_leaves = deque()
+
+    def _compile(self):
+        # Build the counter nodes and the leaves, without recursing
+        group = self.group
+        root = _Node(None, group.is_any)
+        nodes = [root]
+        leaves = self.leaves
+        stack = [(root, group.inputs, False)]
+        while stack:
+            node, inputs, negated = stack.pop()
+            for obj, inverted in inputs:
+                inverted = inverted != negated
+                if isinstance(obj, _Group):
+                    child = _Node(node, obj.is_any != inverted)
+                    nodes.append(child)
+                    stack.append((child, obj.inputs, inverted))
+                else:
+                    leaves.append(_Leaf(self, obj, node, inverted))
+                    self.is_async |= obj.is_async
+                node.nb_inputs += 1
+        # Children have been created after their parents
+        nodes.reverse()
+        for node in nodes:
+            if node.is_any:
+                node.threshold = 1
+            else:
+                node.threshold = node.nb_inputs
+            node.value = node.count >= node.threshold
+            if node.parent is not None:
+                node.parent.count += node.value
+        self.root = root
+
+    def _update(self, node, delta):
+        # One of the inputs of "node" has changed
+        while True:
+            node.count += delta
+            value = node.count >= node.threshold
+            if value == node.value:
+                return
+            node.value = value
+            if node.parent is None:
+                self.set_ready(value)
+                return
+            delta = value and 1 or -1
+            node = node.parent
+
+    def arm(self):
+        self._compile()
+        self.set_ready(self.root.value)
+        for leaf in self.leaves:
+            obj = leaf.obj
+            obj.notify_readiness(leaf.on_object_ready)
+            # notify_readiness() only reports a ready object
+            leaf.on_object_ready(obj, obj.ready)
+
+    def get(self):
+        """
+        Returns one of the objects which currently make the expression
+        true (i.e. a ready object for any_of()), or None.
+        """
+        q = self.true_leaves
+        while q:
+            leaf = q[0]
+            if leaf.value:
+                return leaf.obj
+            leaf.queued = False
+            q.popleft()
+        return None
+
+    def objects(self):
+        while True:
+            obj = self.get()
+            if obj is None:
+                break
+            yield obj
+
+    def __or__(self, b):
+        if b is None:
+            return self
+        assert isinstance(b, WaitObject)
+        return any_of([self, b])
+
+    def __ror__(self, b):
+        return self.__or__(b)
+
+    def __and__(self, b):
+        if b is None:
+            return self
+        assert isinstance(b, WaitObject)
+        return all_of([self, b])
+
+    def __rand__(self, b):
+        return self.__and__(b)
+
+    def __invert__(self):
+        return LogicalExpression(True, [(self, True)])
+
+
+def any_of(objs):
+    """
+    Returns a WaitObject which is ready when any of the given
+    WaitObjects is ready (see LogicalExpression). Like LogicalOr,
+    its readiness is only tracked once it is armed (waited upon).
+    """
+    return LogicalExpression(True, [(obj, False) for obj in objs])
+
+def all_of(objs):
+    """
+    Returns a WaitObject which is ready when all of the given
+    WaitObjects are ready (see LogicalExpression).
+    """
+    return LogicalExpression(False, [(obj, False) for obj in objs])
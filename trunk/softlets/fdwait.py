@@ -0,0 +1,86 @@
+"""
+WaitObjects for file descriptor readiness (sockets, pipes...).
+They are multiplexed by the switcher itself, without helper threads.
+"""
+
+from softlets.core import WaitObject, current_switcher
+from softlets.core.poller import READ, WRITE
+
+__all__ = ['Readable', 'Writable']
+
+
+def fileno(f):
+    """
+    Returns the file descriptor of "f", which can be an integer
+    or any object with a fileno() method.
+    """
+    try:
+        return f.fileno()
+    except AttributeError:
+        return f
+
+
+class FdWaitObject(WaitObject):
+    """
+    Base class for Readable and Writable.
+    The object becomes ready when the file descriptor has the awaited
+    event. Its readiness is consumed when a softlet waiting on it is
+    woken up: the switcher then watches the file descriptor again.
+    There should be at most one Readable and one Writable per file
+    descriptor, and they must be cancel()'ed before it is closed.
+    """
+    event = None
+
+    def __init__(self, fd):
+        WaitObject.__init__(self)
+        self.fd = fileno(fd)
+        self.switcher = current_switcher()
+
+    def arm(self):
+        self.switcher.watch_fd(self)
+
+    def get_waiter(self, switcher):
+        waiter = WaitObject.get_waiter(self, switcher)
+        if waiter is not None:
+            self.consume()
+        return waiter
+
+    def consume(self):
+        """
+        Called when a waiting softlet is woken up.
+        Can be overriden by subclasses which manage readiness themselves.
+        """
+        self.clear()
+
+    def clear(self):
+        """
+        Mark the object not ready (e.g. when an operation on the file
+        descriptor would block) and wait for the event again.
+        """
+        if self.ready:
+            self.set_ready(False)
+            if self._armed:
+                self.switcher.watch_fd(self)
+
+    def cancel(self):
+        """
+        Stop watching the file descriptor.
+        """
+        self.switcher.unwatch_fd(self)
+        self._armed = False
+
+
+class Readable(FdWaitObject):
+    """
+    This object becomes ready when the file descriptor (or object
+    with a fileno() method) can be read from without blocking.
+    """
+    event = READ
+
+
+class Writable(FdWaitObject):
+    """
+    This object becomes ready when the file descriptor (or object
+    with a fileno() method) can be written to without blocking.
+    """
+    event = WRITE
@@ -0,0 +1,43 @@
+"""
+Futures hold the results of operations which complete later on.
+"""
+
+from softlets.core import WaitObject, NotDone
+
+__all__ = ['Future']
+
+
+class Future(WaitObject):
+    """
+    This object becomes ready when the operation it stands for has
+    completed. get() then returns the result of the operation, or
+    raises the exception it failed with.
+    """
+    def __init__(self):
+        WaitObject.__init__(self)
+        self.done = False
+        self.result = None
+        self.exception = None
+        self.traceback = None
+
+    def set_result(self, result):
+        self.result = result
+        self.done = True
+        self.set_ready(True)
+
+    def set_exception(self, exception, traceback=None):
+        self.exception = exception
+        self.traceback = traceback
+        self.done = True
+        self.set_ready(True)
+
+    def get(self):
+        """
+        Returns the result of the operation, or raises its exception.
+        Raises NotDone if the operation hasn't completed yet.
+        """
+        if not self.done:
+            raise NotDone()
+        if self.exception is not None:
+            raise self.exception, None, self.traceback
+        return self.result
@@ -0,0 +1,365 @@
+"""
+Cooperative sockets. Operations return Futures to be yield'ed:
+
+    f = connect(address)
+    yield f
+    stream = f.get()
+    stream.write("hello\n")
+    f = stream.readline()
+    yield f
+    line = f.get()
+"""
+
+import os
+import socket
+from errno import EAGAIN, EWOULDBLOCK, EINTR, EINPROGRESS
+
+from softlets.core import Error
+from softlets.fdwait import Readable, Writable
+from softlets.future import Future
+
+__all__ = ['connect', 'listen', 'Stream', 'Listener', 'Closed']
+
+_would_block = (EAGAIN, EWOULDBLOCK, EINTR)
+
+# Data is received into this buffer before being appended to the
+# stream's own buffer, so that idle streams don't hold any memory
+_chunk_size = 65536
+_scratch = bytearray(_chunk_size)
+_scratch_view = memoryview(_scratch)
+
+
+class Closed(Error):
+    """
+    The stream or listener has been closed.
+    """
+
+
+def _family(address):
+    if isinstance(address, basestring):
+        return socket.AF_UNIX
+    return socket.AF_INET
+
+
+class Stream(object):
+    """
+    A buffered, cooperative stream over a connected socket.
+    At most one read (read() or readline()) can be pending at a time.
+    """
+    def __init__(self, sock):
+        sock.setblocking(0)
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.eof = False
+        self.error = None
+        # Received data not returned yet is rbuf[rpos:]
+        self.rbuf = bytearray()
+        self.rpos = 0
+        self.read_future = None
+        self.read_size = None
+        # Data not sent yet is wbuf[wpos:]
+        self.wbuf = bytearray()
+        self.wpos = 0
+        self.drain_futures = []
+        self.readable = Readable(sock)
+        self.readable.notify_readiness(self._on_readable)
+        self.writable = None
+
+    #
+    # Reading
+    #
+    def read(self, size=_chunk_size):
+        """
+        Returns a Future for up to "size" bytes of data.
+        The result is an empty string at the end of the stream.
+        """
+        return self._start_read(size)
+
+    def readline(self):
+        """
+        Returns a Future for a whole line, including the trailing newline.
+        The result doesn't end with a newline at the end of the stream.
+        """
+        return self._start_read(None)
+
+    def _start_read(self, size):
+        assert self.read_future is None, "a read is already pending"
+        future = Future()
+        self.read_future = future
+        self.read_size = size
+        self._try_read()
+        return future
+
+    def _on_readable(self, readable, ready):
+        if ready and self.read_future is not None:
+            self._try_read()
+
+    def _try_read(self):
+        # Try to complete the pending read with the data at hand,
+        # receive more data while the socket is readable
+        while True:
+            data = self._take()
+            if data is not None:
+                break
+            if self.error is not None:
+                future = self.read_future
+                self.read_future = None
+                future.set_exception(self.error)
+                return
+            if self.eof:
+                data = self._take_all()
+                break
+            if not self.readable.ready or not self._recv():
+                return
+        future = self.read_future
+        self.read_future = None
+        future.set_result(data)
+
+    def _recv(self):
+        # Returns False if no data is available right now
+        try:
+            n = self.sock.recv_into(_scratch)
+        except socket.error, e:
+            if e.args[0] in _would_block:
+                self.readable.clear()
+                return False
+            self.error = e
+            return True
+        if n:
+            self.rbuf += _scratch_view[:n]
+            if n < _chunk_size:
+                # The socket has most probably been drained, wait for
+                # the next event rather than get EAGAIN
+                self.readable.clear()
+        else:
+            self.eof = True
+        return True
+
+    def _take(self):
+        # Returns None if the pending read can't be completed
+        # with the buffered data
+        rbuf, rpos = self.rbuf, self.rpos
+        available = len(rbuf) - rpos
+        if not available:
+            return None
+        size = self.read_size
+        if size is None:
+            pos = rbuf.find('\n', rpos)
+            if pos < 0:
+                return None
+            size = pos + 1 - rpos
+        else:
+            size = min(size, available)
+        return self._consume(size)
+
+    def _take_all(self):
+        return self._consume(len(self.rbuf) - self.rpos)
+
+    def _consume(self, size):
+        rbuf, rpos = self.rbuf, self.rpos
+        end = rpos + size
+        data = memoryview(rbuf)[rpos:end].tobytes()
+        if end == len(rbuf):
+            # Release the memory instead of keeping it around
+            self.rbuf = bytearray()
+            self.rpos = 0
+        elif end > _chunk_size and end * 2 > len(rbuf):
+            # Compact when the consumed part dominates
+            del rbuf[:end]
+            self.rpos = 0
+        else:
+            self.rpos = end
+        return data
+
+    #
+    # Writing
+    #
+    def write(self, data):
+        """
+        Write "data" to the stream. Data which can't be sent right
+        away is buffered, use drain() to wait for it to be sent.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.wpos == len(self.wbuf):
+            # Nothing buffered, try sending directly
+            n = self._send(data)
+            if n == len(data):
+                return
+            self.wbuf += memoryview(data)[n:]
+            self._wait_writable()
+        else:
+            self.wbuf += data
+
+    def drain(self):
+        """
+        Returns a Future which completes when all written
+        data has been sent.
+        """
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        elif self.wpos == len(self.wbuf):
+            future.set_result(None)
+        else:
+            self.drain_futures.append(future)
+        return future
+
+    def _send(self, data):
+        # Returns the number of bytes sent
+        try:
+            return self.sock.send(data)
+        except socket.error, e:
+            if e.args[0] in _would_block:
+                return 0
+            self._set_write_error(e)
+            raise
+
+    def _set_write_error(self, e):
+        self.error = e
+        futures = self.drain_futures
+        self.drain_futures = []
+        for future in futures:
+            future.set_exception(e)
+
+    def _wait_writable(self):
+        if self.writable is None:
+            self.writable = Writable(self.sock)
+            self.writable.notify_readiness(self._on_writable)
+        else:
+            self.writable.clear()
+
+    def _on_writable(self, writable, ready):
+        if ready:
+            self._flush()
+
+    def _flush(self):
+        wbuf = self.wbuf
+        while self.wpos < len(wbuf):
+            try:
+                n = self.sock.send(memoryview(wbuf)[self.wpos:])
+            except socket.error, e:
+                if e.args[0] in _would_block:
+                    self.writable.clear()
+                    return
+                self._set_write_error(e)
+                return
+            self.wpos += n
+        self.wbuf = bytearray()
+        self.wpos = 0
+        futures = self.drain_futures
+        self.drain_futures = []
+        for future in futures:
+            future.set_result(None)
+
+    def close(self):
+        """
+        Close the stream. Buffered data which hasn't been sent is lost.
+        Pending reads and drains fail with Closed, as do later ones.
+        """
+        self.readable.cancel()
+        if self.writable is not None:
+            self.writable.cancel()
+        self.sock.close()
+        self.error = error = Closed()
+        future = self.read_future
+        if future is not None:
+            self.read_future = None
+            future.set_exception(error)
+        futures = self.drain_futures
+        self.drain_futures = []
+        for future in futures:
+            future.set_exception(error)
+
+
+class Listener(object):
+    """
+    A listening socket accepting connections.
+    """
+    def __init__(self, sock):
+        sock.setblocking(0)
+        self.sock = sock
+        self.accept_futures = []
+        self.readable = Readable(sock)
+        self.readable.notify_readiness(self._on_readable)
+
+    def accept(self):
+        """
+        Returns a Future for the next incoming connection.
+        The result is a (stream, address) tuple.
+        """
+        future = Future()
+        self.accept_futures.append(future)
+        self._try_accept()
+        return future
+
+    def _on_readable(self, readable, ready):
+        if ready:
+            self._try_accept()
+
+    def _try_accept(self):
+        futures = self.accept_futures
+        while futures and self.readable.ready:
+            try:
+                sock, address = self.sock.accept()
+            except socket.error, e:
+                if e.args[0] in _would_block:
+                    self.readable.clear()
+                    return
+                futures.pop(0).set_exception(e)
+            else:
+                futures.pop(0).set_result((Stream(sock), address))
+
+    def close(self):
+        """
+        Close the listener. Pending accepts fail with Closed.
+        """
+        self.readable.cancel()
+        self.sock.close()
+        futures = self.accept_futures
+        self.accept_futures = []
+        for future in futures:
+            future.set_exception(Closed())
+
+
+def listen(address, backlog=128):
+    """
+    Listen on "address" (a (host, port) tuple, or a path
+    for a Unix socket), and return a Listener.
+    """
+    sock = socket.socket(_family(address), socket.SOCK_STREAM)
+    if sock.family == socket.AF_INET:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    return Listener(sock)
+
+def connect(address):
+    """
+    Connect to "address" (a (host, port) tuple, or a path for
+    a Unix socket). Returns a Future whose result is a Stream.
+    """
+    sock = socket.socket(_family(address), socket.SOCK_STREAM)
+    sock.setblocking(0)
+    future = Future()
+    err = sock.connect_ex(address)
+    if err == 0:
+        future.set_result(Stream(sock))
+    elif err in (EINPROGRESS, EAGAIN, EWOULDBLOCK):
+        writable = Writable(sock)
+        def on_writable(obj, ready):
+            if not ready or future.done:
+                return
+            writable.cancel()
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                sock.close()
+                future.set_exception(socket.error(err, os.strerror(err)))
+            else:
+                future.set_result(Stream(sock))
+        writable.notify_readiness(on_writable)
+    else:
+        sock.close()
+        future.set_exception(socket.error(err, os.strerror(err)))
+    return future
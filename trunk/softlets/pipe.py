@@ -0,0 +1,186 @@
+"""
+Non-blocking pipe readers and writers, e.g. to stream the
+output of a subprocess.
+"""
+
+import os
+import errno
+
+from softlets.core.poller import set_non_blocking
+from softlets.fdwait import Readable, Writable
+
+__all__ = ['PipeReader', 'PipeWriter']
+
+
+class _PipeEnd(object):
+    """
+    Mixin for pipe readers and writers, which manage their readiness
+    themselves: they are not ready anymore only when an operation
+    would block.
+    """
+    def __init__(self, f):
+        # Keep a reference to the file object so that it isn't closed
+        self.file = f
+        set_non_blocking(self.fd)
+
+    def consume(self):
+        pass
+
+    def close(self):
+        """
+        Close the underlying pipe.
+        """
+        self.cancel()
+        try:
+            self.file.close()
+        except AttributeError:
+            os.close(self.fd)
+
+
+class PipeReader(_PipeEnd, Readable):
+    """
+    Reads incrementally from a pipe (or a file object wrapping it).
+    The PipeReader is ready when data can be read without blocking,
+    or when the end of the pipe has been reached ("eof" is True).
+    """
+    def __init__(self, f, chunk_size=65536):
+        Readable.__init__(self, f)
+        _PipeEnd.__init__(self, f)
+        self.chunk_size = chunk_size
+        # Data not returned yet is rbuf[rpos:], with no newline
+        # in rbuf[rpos:rscan]
+        self.rbuf = bytearray()
+        self.rpos = 0
+        self.rscan = 0
+        self.eof = False
+
+    def arm(self):
+        if not self.eof:
+            Readable.arm(self)
+
+    def _update(self):
+        # Stay ready as long as something can be returned without blocking
+        if self.eof or self._find_newline() >= 0:
+            self.set_ready(True)
+        else:
+            self.clear()
+
+    def _find_newline(self):
+        # Each byte is only scanned once
+        rbuf = self.rbuf
+        pos = rbuf.find('\n', self.rscan)
+        if pos < 0:
+            self.rscan = len(rbuf)
+        else:
+            self.rscan = pos
+        return pos
+
+    def _recv(self):
+        # Returns None if no data is available right now,
+        # and an empty string at the end of the pipe
+        try:
+            data = os.read(self.fd, self.chunk_size)
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+            return None
+        if not data:
+            self.eof = True
+            self.cancel()
+        return data
+
+    def _consume(self, size):
+        rbuf, rpos = self.rbuf, self.rpos
+        end = rpos + size
+        data = str(rbuf[rpos:end])
+        if end == len(rbuf):
+            # Release the memory instead of keeping it around
+            self.rbuf = bytearray()
+            self.rscan = end = 0
+        elif end > self.chunk_size and end * 2 > len(rbuf):
+            # Compact when the consumed part dominates
+            del rbuf[:end]
+            self.rscan -= end
+            end = 0
+        self.rpos = end
+        if self.rscan < end:
+            self.rscan = end
+        return data
+
+    def read(self):
+        """
+        Read a chunk of data. Returns an empty string if nothing
+        is available (or if the end of the pipe has been reached).
+        """
+        if self.rpos < len(self.rbuf):
+            data = self._consume(len(self.rbuf) - self.rpos)
+        elif not self.eof:
+            # Nothing buffered: return what is read without copying it
+            data = self._recv() or ''
+        else:
+            data = ''
+        self._update()
+        return data
+
+    def readline(self):
+        """
+        Read a whole line, including the trailing newline. Returns None
+        if no whole line is available yet, and an empty string once the
+        end of the pipe has been reached and everything has been read.
+        The PipeReader stays ready as long as other lines are buffered.
+        """
+        rbuf = self.rbuf
+        pos = rbuf.find('\n', self.rscan)
+        if pos >= 0:
+            end = pos + 1
+            pos = rbuf.find('\n', end)
+            if pos >= 0:
+                # Another line is buffered: stay ready
+                line = str(rbuf[self.rpos:end])
+                self.rpos = end
+                self.rscan = pos
+                if not self.ready:
+                    self.set_ready(True)
+                return line
+        pos = self._find_newline()
+        while pos < 0 and not self.eof:
+            data = self._recv()
+            if not data:
+                break
+            self.rbuf += data
+            pos = self._find_newline()
+        if pos < 0:
+            if self.eof:
+                line = self._consume(len(self.rbuf) - self.rpos)
+            else:
+                line = None
+            self._update()
+            return line
+        line = self._consume(pos + 1 - self.rpos)
+        self._update()
+        return line
+
+
+class PipeWriter(_PipeEnd, Writable):
+    """
+    Writes incrementally to a pipe (or a file object wrapping it).
+    The PipeWriter is ready when data can be written without blocking.
+    """
+    def __init__(self, f):
+        Writable.__init__(self, f)
+        _PipeEnd.__init__(self, f)
+
+    def write(self, data):
+        """
+        Write as much of "data" as possible without blocking.
+        Returns the number of bytes written.
+        """
+        try:
+            n = os.write(self.fd, data)
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+            n = 0
+        if n < len(data):
+            self.clear()
+        return n
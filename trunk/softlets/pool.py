@@ -0,0 +1,353 @@
+"""
+Pools of worker threads to offload blocking calls (file I/O, DNS
+lookups, C library calls...) from the switcher, and of worker
+processes to offload CPU-bound work.
+"""
+
+import sys
+import cPickle as pickle
+import traceback
+import threading
+from threading import Thread
+from collections import deque
+
+from softlets.core import current_switcher
+from softlets.core.common import _singleton
+from softlets.future import Future
+
+__all__ = [
+    'ThreadPool', 'offload', 'default_pool',
+    'ProcessPool', 'run_in_process', 'map_in_process', 'default_process_pool',
+    ]
+
+
+class _Completions(object):
+    """
+    Completed calls waiting to be delivered to their switchers.
+    Calls completed while the switcher hasn't picked them up yet
+    are delivered together, in a single async call.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = {}
+
+    def add(self, switcher, future, result):
+        # Called out-of-thread
+        # "result" is a (ok, value or exception, traceback) tuple
+        try:
+            self.lock.acquire()
+            try:
+                self.completed[switcher].append((future, result))
+                return
+            except KeyError:
+                self.completed[switcher] = [(future, result)]
+        finally:
+            self.lock.release()
+        # First completion since the last delivery
+        def f():
+            self.deliver(switcher)
+        switcher.push_async_call(f)
+
+    def deliver(self, switcher):
+        # Called in-thread
+        try:
+            self.lock.acquire()
+            completed = self.completed.pop(switcher)
+        finally:
+            self.lock.release()
+        for future, (ok, value, tb) in completed:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value, tb)
+
+
+class ThreadPool(object):
+    """
+    A bounded pool of worker threads. Threads are started on demand,
+    up to "size" threads.
+    Completions are delivered to the switcher in batches.
+    """
+    default_size = 8
+
+    def __init__(self, size=None):
+        self.size = size or self.default_size
+        self.cond = threading.Condition(threading.Lock())
+        self.tasks = deque()
+        self.threads = set()
+        self.nb_idle = 0
+        self.completions = _Completions()
+
+    def set_size(self, size):
+        """
+        Change the maximum number of worker threads.
+        Extra threads exit once they have finished their current call.
+        """
+        try:
+            self.cond.acquire()
+            self.size = size
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def submit(self, func, *args, **kargs):
+        """
+        Call func(*args, **kargs) in a worker thread.
+        Returns a Future for the result of the call.
+        """
+        future = Future()
+        # Completion is delivered in-thread, no locking needed
+        future.is_async = True
+        task = (current_switcher(), future, func, args, kargs)
+        try:
+            self.cond.acquire()
+            self.tasks.append(task)
+            if self.nb_idle:
+                self.cond.notify()
+            elif len(self.threads) < self.size:
+                thread = Thread(target=self.run,
+                    name="softlets.pool worker thread")
+                thread.setDaemon(True)
+                self.threads.add(thread)
+                thread.start()
+        finally:
+            self.cond.release()
+        return future
+
+    def run(self):
+        # Worker thread
+        cond = self.cond
+        tasks = self.tasks
+        me = threading.currentThread()
+        while True:
+            try:
+                cond.acquire()
+                while not tasks and len(self.threads) <= self.size:
+                    self.nb_idle += 1
+                    cond.wait()
+                    self.nb_idle -= 1
+                if len(self.threads) > self.size:
+                    self.threads.remove(me)
+                    return
+                switcher, future, func, args, kargs = tasks.popleft()
+            finally:
+                cond.release()
+            try:
+                result = (True, func(*args, **kargs), None)
+            except:
+                exc_type, exc, tb = sys.exc_info()
+                result = (False, exc, tb)
+            self.completions.add(switcher, future, result)
+            # Don't keep the traceback frames alive
+            del result
+
+
+default_pool = _singleton(ThreadPool)
+default_pool.__doc__ = """
+Returns the thread pool used by offload().
+"""
+
+def offload(func, *args, **kargs):
+    """
+    Call func(*args, **kargs) in a worker thread of the default pool,
+    and return a Future for the result:
+        f = offload(os.stat, path)
+        yield f
+        st = f.get()
+    """
+    return default_pool().submit(func, *args, **kargs)
+
+
+#
+# Process pool
+#
+
+def _call(data):
+    # Runs in a worker process, never raises so that the completion
+    # is always reported. The call and its outcome are pickled here
+    # rather than by multiprocessing, which would lose the completion
+    # of a call whose result can't be pickled.
+    func, args, kargs = pickle.loads(data)
+    try:
+        result = (True, func(*args, **kargs), None)
+    except:
+        exc_type, exc, tb = sys.exc_info()
+        text = ''.join(traceback.format_exception(exc_type, exc, tb))
+        result = (False, exc, text)
+        del tb
+    try:
+        return pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        text = traceback.format_exc()
+        if result[0]:
+            what = "unpicklable result returned"
+        else:
+            what = "unpicklable exception raised"
+            text = result[2] + text
+        exc = RuntimeError("%s in worker process:\n%s" % (what, text))
+        return pickle.dumps((False, exc, text), pickle.HIGHEST_PROTOCOL)
+
+def _loads_result(data):
+    # The result of _call(), unpickled in the parent process
+    try:
+        return pickle.loads(data)
+    except Exception:
+        text = traceback.format_exc()
+        return (False, RuntimeError(
+            "result of worker process can't be unpickled:\n" + text), text)
+
+def _map_chunk(func, chunk):
+    return map(func, chunk)
+
+
+class _RemoteResult(object):
+    """
+    Turns the traceback text of a failed remote call into an attribute
+    of the exception, since tracebacks can't be transferred.
+    """
+    def __init__(self, future):
+        self.future = future
+
+    def set_result(self, result):
+        self.future.set_result(result)
+
+    def set_exception(self, exc, text):
+        exc.remote_traceback = text
+        self.future.set_exception(exc)
+
+
+class _MapChunk(_RemoteResult):
+    """
+    One chunk of a map_in_process() call.
+    """
+    def __init__(self, future, results, index):
+        self.future = future
+        self.results = results
+        self.index = index
+
+    def set_result(self, values):
+        results = self.results
+        results[self.index] = values
+        results.nb_pending -= 1
+        if not results.nb_pending and not self.future.done:
+            values = []
+            for chunk in results:
+                values.extend(chunk)
+            self.future.set_result(values)
+
+    def set_exception(self, exc, text):
+        if not self.future.done:
+            _RemoteResult.set_exception(self, exc, text)
+
+
+class _ChunkList(list):
+    nb_pending = 0
+
+
+class ProcessPool(object):
+    """
+    A pool of worker processes (built upon multiprocessing.Pool)
+    for CPU-bound work. Functions and arguments must be picklable.
+    Completions are delivered to the switcher in batches.
+    Exceptions raised by the calls are re-raised by Future.get(),
+    with the remote traceback text as their "remote_traceback"
+    attribute.
+    """
+    def __init__(self, size=None):
+        """
+        Create a pool of "size" processes (by default,
+        the number of CPUs). Processes are started on first use.
+        """
+        self.size = size
+        self.pool = None
+        self.completions = _Completions()
+
+    def _get_pool(self):
+        if self.pool is None:
+            import multiprocessing
+            self.pool = multiprocessing.Pool(self.size)
+            self.size = self.size or multiprocessing.cpu_count()
+        return self.pool
+
+    def _submit(self, target, func, args, kargs):
+        try:
+            data = pickle.dumps((func, args, kargs), pickle.HIGHEST_PROTOCOL)
+        except Exception, e:
+            target.set_exception(e, traceback.format_exc())
+            return
+        switcher = current_switcher()
+        completions = self.completions
+        def on_result(data):
+            # Called in the pool's result handler thread
+            completions.add(switcher, target, _loads_result(data))
+        self._get_pool().apply_async(_call, (data,), callback=on_result)
+
+    def _new_future(self):
+        future = Future()
+        # Completion is delivered in-thread, no locking needed
+        future.is_async = True
+        return future
+
+    def submit(self, func, *args, **kargs):
+        """
+        Call func(*args, **kargs) in a worker process.
+        Returns a Future for the result of the call.
+        """
+        future = self._new_future()
+        self._submit(_RemoteResult(future), func, args, kargs)
+        return future
+
+    def map(self, func, iterable, chunksize=None):
+        """
+        Call func() on each item of "iterable" in worker processes.
+        Items are sent in chunks of "chunksize" items, to amortize
+        the cost of the transfers. Returns a Future for the list of
+        results.
+        """
+        items = list(iterable)
+        future = self._new_future()
+        if not items:
+            future.set_result([])
+            return future
+        self._get_pool()
+        if chunksize is None:
+            # Same heuristic as multiprocessing
+            chunksize, extra = divmod(len(items), self.size * 4)
+            if extra:
+                chunksize += 1
+        results = _ChunkList()
+        for i in xrange(0, len(items), chunksize):
+            target = _MapChunk(future, results, len(results))
+            results.append(None)
+            results.nb_pending += 1
+            self._submit(target, _map_chunk, (func, items[i:i + chunksize]), {})
+        return future
+
+    def close(self):
+        """
+        Terminate the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+default_process_pool = _singleton(ProcessPool)
+default_process_pool.__doc__ = """
+Returns the process pool used by run_in_process() and map_in_process().
+"""
+
+def run_in_process(func, *args, **kargs):
+    """
+    Call func(*args, **kargs) in a worker process of the default
+    process pool, and return a Future for the result.
+    """
+    return default_process_pool().submit(func, *args, **kargs)
+
+def map_in_process(func, iterable, chunksize=None):
+    """
+    Call func() on each item of "iterable" in worker processes of the
+    default process pool, and return a Future for the list of results.
+    """
+    return default_process_pool().map(func, iterable, chunksize)
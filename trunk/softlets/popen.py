@@ -1,8 +1,16 @@
 
+import os
+import errno
+import select
+import signal
 import subprocess
+import threading
 from threading import Thread
 
 from softlets.core import WaitObject
+from softlets.core import begin_async_batch, end_async_batch
+from softlets.core.poller import set_non_blocking
+from softlets.pipe import PipeReader, PipeWriter
 
 
 # For convenience
@@ -10,6 +18,153 @@ from subprocess import *
 __all__ = list(subprocess.__all__)
 
 
+#
+# SIGCHLD self-pipe: the signal makes Python write a byte to the pipe,
+# from whichever thread it is delivered to (see signal.set_wakeup_fd())
+#
+_sigchld_pipe = [None]
+
+def _on_sigchld(signum, frame):
+    pass
+
+def _setup_sigchld():
+    # Returns the read end of the self-pipe, or None if SIGCHLD can't
+    # be used: signals can only be set up from the main thread, and
+    # SIGCHLD or the wakeup fd may already be used by the application
+    if not isinstance(threading.current_thread(), threading._MainThread):
+        return None
+    if signal.getsignal(signal.SIGCHLD) not in (signal.SIG_DFL, _on_sigchld):
+        return None
+    old_pipe = _sigchld_pipe[0]
+    r, w = os.pipe()
+    set_non_blocking(r)
+    set_non_blocking(w)
+    old_fd = signal.set_wakeup_fd(w)
+    if old_fd != -1 and (old_pipe is None or old_fd != old_pipe[1]):
+        signal.set_wakeup_fd(old_fd)
+        os.close(r)
+        os.close(w)
+        return None
+    if old_pipe is not None:
+        # Inherited from the parent process
+        os.close(old_pipe[0])
+        os.close(old_pipe[1])
+    _sigchld_pipe[0] = (r, w)
+    signal.signal(signal.SIGCHLD, _on_sigchld)
+    # Don't interrupt system calls which can be restarted
+    signal.siginterrupt(signal.SIGCHLD, False)
+    return r
+
+
+class _Reaper(object):
+    """
+    A single helper thread polling all the running subprocesses.
+    Subprocesses which are found finished in the same round are
+    delivered to the switcher in a single async call.
+
+    If the first subprocess is started from the main thread and SIGCHLD
+    isn't handled by the application, a round is run each time SIGCHLD
+    is received: the end of a subprocess is noticed right away (the
+    signal only interrupts the main thread's system calls which can't
+    be restarted, e.g. select()). Otherwise, the helper thread polls
+    with a backoff: the end of a subprocess may be noticed up to
+    max_interval seconds late.
+    """
+    # Polling interval bounds: the interval is doubled each time a
+    # round finds nothing, and reset when a subprocess is added or ends
+    min_interval = 0.001
+    max_interval = 0.05
+    # Rounds are still run that often with SIGCHLD, just in case
+    sigchld_interval = 1.0
+
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.running = []
+        self.thread = None
+        self.interval = self.min_interval
+        # Read end of the SIGCHLD self-pipe, if used
+        self.sigchld_fd = None
+
+    def add(self, popen):
+        try:
+            self.cond.acquire()
+            self.running.append(popen)
+            self.interval = self.min_interval
+            if self.thread is None:
+                self.sigchld_fd = _setup_sigchld()
+                self.thread = Thread(target=self.run,
+                    name="softlets.popen reaper thread")
+                self.thread.setDaemon(True)
+                self.thread.start()
+            else:
+                self.cond.notify()
+                if self.sigchld_fd is not None:
+                    # It may have ended before being added: run a round
+                    try:
+                        os.write(_sigchld_pipe[0][1], 'x')
+                    except OSError, e:
+                        if e.errno != errno.EAGAIN:
+                            raise
+        finally:
+            self.cond.release()
+
+    def wait_sigchld(self):
+        try:
+            select.select([self.sigchld_fd], [], [], self.sigchld_interval)
+        except (select.error, EnvironmentError), e:
+            if e.args[0] != errno.EINTR:
+                raise
+        try:
+            os.read(self.sigchld_fd, 4096)
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def poll(self):
+        # Returns the list of finished Popen objects
+        try:
+            self.cond.acquire()
+            while not self.running:
+                self.cond.wait()
+            running = self.running
+        finally:
+            self.cond.release()
+        finished = []
+        for popen in running:
+            r = popen.popen.poll()
+            if r is not None:
+                popen.retcode = r
+                finished.append(popen)
+        try:
+            self.cond.acquire()
+            if finished:
+                # Subprocesses may have been added in the meantime
+                done = set(finished)
+                self.running = [p for p in self.running if p not in done]
+                self.interval = self.min_interval
+            elif self.sigchld_fd is None:
+                self.cond.wait(self.interval)
+                self.interval = min(self.interval * 2, self.max_interval)
+        finally:
+            self.cond.release()
+        if not finished and self.sigchld_fd is not None:
+            self.wait_sigchld()
+        return finished
+
+    def run(self):
+        while True:
+            finished = self.poll()
+            if finished:
+                begin_async_batch()
+                try:
+                    for popen in finished:
+                        popen._on_subprocess_exited()
+                finally:
+                    end_async_batch()
+
+_reaper = _Reaper()
+
+
 class Popen(WaitObject):
     """
     Executes a command in a subprocess (with the same args as
@@ -17,9 +172,15 @@ class Popen(WaitObject):
     The following properties are defined:
     - popen: the underlying subprocess.Popen object
     - retcode: the return code of the subprocess (if finished)
+    - stdout, stderr: PipeReader objects streaming the subprocess output,
+      if the corresponding argument was PIPE (otherwise None)
+    - stdin: a PipeWriter object feeding the subprocess input,
+      if the corresponding argument was PIPE (otherwise None)
+    The pipe wrappers are created on first access, which makes the
+    pipe non-blocking: pipes only used through "popen" (e.g. with
+    communicate()) must not be accessed through them.
 
-    The implementation is not optimal, as a helper thread is created
-    for each subprocess.
+    All running subprocesses are polled by a single helper thread.
     """
     def __init__(self, *args, **kargs):
         """
@@ -31,30 +192,44 @@ class Popen(WaitObject):
         self.protect()
         self.popen = subprocess.Popen(*args, **kargs)
         self.finished = False
-        self._thread = None
+        # Pipe wrappers, created on first use
+        self._pipe_ends = {}
+
+    def _pipe_end(self, name, cls):
+        ends = self._pipe_ends
+        try:
+            return ends[name]
+        except KeyError:
+            f = getattr(self.popen, name)
+            end = ends[name] = f and cls(f) or None
+            return end
+
+    def _get_stdout(self):
+        return self._pipe_end('stdout', PipeReader)
+    stdout = property(_get_stdout, doc="""
+        A PipeReader for the subprocess output, or None.
+        """)
+
+    def _get_stderr(self):
+        return self._pipe_end('stderr', PipeReader)
+    stderr = property(_get_stderr, doc="""
+        A PipeReader for the subprocess error output, or None.
+        """)
+
+    def _get_stdin(self):
+        return self._pipe_end('stdin', PipeWriter)
+    stdin = property(_get_stdin, doc="""
+        A PipeWriter for the subprocess input, or None.
+        """)
 
     def arm(self):
         r = self.popen.poll()
         if r is not None:
-            # Avoid launching a thread if already finished
+            # Avoid polling if already finished
             self.retcode = r
             self._on_subprocess_exited()
         else:
-            self._start_polling()
-
-    def _start_polling(self):
-        # We create a thread for each subprocess, because Python
-        # has no portable primitive to wait asynchronously for
-        # multiple processes.
-        # XXX: try a poll/sleep loop instead
-        self._thread = Thread(target=self._blocking_wait,
-            name="softlets.popen helper thread")
-        self._thread.setDaemon(True)
-        self._thread.start()
-
-    def _blocking_wait(self):
-        self.retcode = self.popen.wait()
-        self._on_subprocess_exited()
+            _reaper.add(self)
 
     def _on_subprocess_exited(self):
         self.finished = True
@@ -1,33 +1,194 @@
 
-from softlets.core import WaitObject
+from collections import deque
+from heapq import heappush, heappop, heapify
+
+from softlets.core import WaitObject, Error
+
+__all__ = ['Queue', 'PriorityQueue', 'LifoQueue', 'Full']
+
+
+class Full(Error):
+    """
+    The queue is full.
+    """
+
 
 class Queue(WaitObject):
     """
     A general message queue (FIFO) to communicate between threads.
     Can contain any kind of objects.
+    The queue is ready when it is not empty. If "maxsize" is greater
+    than 0, the queue can hold at most "maxsize" values, and producers
+    can wait on the "not_full" WaitObject before putting values.
     """
-    def __init__(self):
+    __slots__ = ('data', 'maxsize', '_not_full')
+
+    def __init__(self, maxsize=0):
         WaitObject.__init__(self)
-        self.data = []
+        self.data = self._init()
+        self.maxsize = maxsize
+        # Created on first use
+        self._not_full = None
+
+    def _get_not_full(self):
+        not_full = self._not_full
+        if not_full is None:
+            not_full = self._not_full = WaitObject()
+            not_full.set_ready(not self.full())
+        return not_full
+    not_full = property(_get_not_full, doc="""
+        A WaitObject which is ready when the queue isn't full.
+        """)
+
+    def _set_not_full(self, ready):
+        if self._not_full is not None:
+            self._not_full.set_ready(ready)
+
+    def full(self):
+        """
+        Returns True if the queue can't accept any more values.
+        """
+        return self.maxsize > 0 and len(self.data) >= self.maxsize
 
     def put(self, value):
         """
         Put a value in the queue.
+        Raises Full if the queue is full.
         """
 #         _lock.acquire()
-        if not self.data:
+        data = self.data
+        if self.maxsize > 0:
+            n = len(data)
+            if n >= self.maxsize:
+                raise Full()
+            if n + 1 == self.maxsize:
+                self._set_not_full(False)
+        if not data:
             self.set_ready(True)
-        self.data.append(value)
+        self._put(value)
 #         _lock.release()
 
+    def put_many(self, values):
+        """
+        Put several values in the queue at once.
+        Raises Full (without putting anything) if they don't all fit.
+        """
+        data = self.data
+        was_empty = not data
+        if self.maxsize > 0:
+            values = list(values)
+            n = len(data) + len(values)
+            if n > self.maxsize:
+                raise Full()
+            if n == self.maxsize and values:
+                self._set_not_full(False)
+        self._put_many(values)
+        if was_empty and data:
+            self.set_ready(True)
+
     def get(self):
         """
         Get and remove a value from the queue.
         """
 #         _lock.acquire()
-        if len(self.data) == 1:
+        data = self.data
+        if len(data) == self.maxsize:
+            self._set_not_full(True)
+        if len(data) == 1:
             self.set_ready(False)
-        value = self.data.pop(0)
+        value = self._get()
 #         _lock.release()
         return value
 
+    def get_many(self, max_items=None):
+        """
+        Get and remove several values from the queue, up to "max_items"
+        (or all the values if "max_items" is None).
+        Returns a list, which is empty if the queue is empty.
+        """
+        data = self.data
+        if max_items is None or max_items > len(data):
+            max_items = len(data)
+        values = self._get_many(max_items)
+        if values:
+            if not data:
+                self.set_ready(False)
+            if self.maxsize > 0 and len(data) < self.maxsize:
+                self._set_not_full(True)
+        return values
+
+    #
+    # Storage, can be overriden to implement other queueing disciplines
+    #
+    def _init(self):
+        return deque()
+
+    def _put(self, value):
+        self.data.append(value)
+
+    def _put_many(self, values):
+        self.data.extend(values)
+
+    def _get(self):
+        return self.data.popleft()
+
+    def _get_many(self, n):
+        data = self.data
+        if n == len(data):
+            values = list(data)
+            data.clear()
+            return values
+        popleft = data.popleft
+        return [popleft() for i in xrange(n)]
+
+
+class PriorityQueue(Queue):
+    """
+    A message queue which returns the lowest value first.
+    Values are typically (priority, data) tuples.
+    """
+    __slots__ = ()
+
+    def _init(self):
+        return []
+
+    def _put(self, value):
+        heappush(self.data, value)
+
+    def _put_many(self, values):
+        data = self.data
+        if not data:
+            data.extend(values)
+            heapify(data)
+        else:
+            for value in values:
+                heappush(data, value)
+
+    def _get(self):
+        return heappop(self.data)
+
+    def _get_many(self, n):
+        data = self.data
+        return [heappop(data) for i in xrange(n)]
+
+
+class LifoQueue(Queue):
+    """
+    A message queue which returns the most recently put value first.
+    """
+    __slots__ = ()
+
+    def _init(self):
+        return []
+
+    def _get(self):
+        return self.data.pop()
+
+    def _get_many(self, n):
+        if not n:
+            return []
+        data = self.data
+        values = data[-n:]
+        del data[-n:]
+        values.reverse()
+        return values
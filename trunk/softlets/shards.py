@@ -0,0 +1,308 @@
+"""
+Softlets spread over several forked processes (shards), each running
+its own switcher, to use several CPU cores. Processes communicate
+through PipeQueues.
+"""
+
+import os
+import sys
+import errno
+import select
+import struct
+import traceback
+import cPickle as pickle
+
+from softlets.core import Softlet, current_switcher, main_loop
+from softlets.core.waitobject import LogicalOr
+from softlets.core.poller import set_non_blocking
+from softlets.fdwait import Readable, Writable
+from softlets.queue import Queue
+from softlets import pool, popen, timer
+
+__all__ = ['PipeQueue', 'Shards']
+
+_header = struct.Struct('!I')
+_chunk_size = 65536
+
+
+class PipeQueue(Queue):
+    """
+    A queue between two processes, over a pipe: one process puts
+    values, the other one gets them. Values must be picklable.
+    The queue must be created before forking. It is ready (in the
+    getting process) when values have been received.
+    Put values are buffered if the pipe is full, and flushed by the
+    switcher when it becomes writable again.
+    """
+    def __init__(self):
+        Queue.__init__(self)
+        self.rfd, self.wfd = os.pipe()
+        set_non_blocking(self.rfd)
+        set_non_blocking(self.wfd)
+        self.readable = None
+        self.writable = None
+        # Received data not decoded yet is rbuf[rpos:]
+        self.rbuf = bytearray()
+        self.rpos = 0
+        # Data not sent yet is wbuf[wpos:]
+        self.wbuf = bytearray()
+        self.wpos = 0
+
+    #
+    # Getting side
+    #
+    def arm(self):
+        self.readable = Readable(self.rfd)
+        self.readable.notify_readiness(self._on_readable)
+
+    def _on_readable(self, readable, ready):
+        if not ready:
+            return
+        while True:
+            try:
+                data = os.read(self.rfd, _chunk_size)
+            except OSError, e:
+                if e.errno not in (errno.EAGAIN, errno.EINTR):
+                    raise
+                readable.clear()
+                break
+            if not data:
+                # All writers have closed the pipe
+                readable.cancel()
+                break
+            self.rbuf += data
+            if len(data) < _chunk_size:
+                readable.clear()
+                break
+        self._decode()
+
+    def _decode(self):
+        rbuf, rpos = self.rbuf, self.rpos
+        end = len(rbuf)
+        values = []
+        while end - rpos >= _header.size:
+            size, = _header.unpack_from(rbuf, rpos)
+            start = rpos + _header.size
+            if end - start < size:
+                break
+            values.extend(pickle.loads(str(rbuf[start:start + size])))
+            rpos = start + size
+        if rpos == end:
+            self.rbuf = bytearray()
+            self.rpos = 0
+        else:
+            self.rpos = rpos
+        if values:
+            Queue.put_many(self, values)
+
+    #
+    # Putting side
+    #
+    def put(self, value):
+        """
+        Send a value to the other process.
+        """
+        self._send([value])
+
+    def put_many(self, values):
+        """
+        Send several values to the other process at once.
+        """
+        values = list(values)
+        if values:
+            self._send(values)
+
+    def _send(self, values):
+        data = pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+        frame = _header.pack(len(data)) + data
+        if self.wpos == len(self.wbuf):
+            # Nothing buffered, try writing directly
+            n = self._write(frame)
+            if n == len(frame):
+                return
+            self.wbuf += buffer(frame, n)
+            self._wait_writable()
+        else:
+            self.wbuf += frame
+
+    def _write(self, data):
+        try:
+            return os.write(self.wfd, data)
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+            return 0
+
+    def _wait_writable(self):
+        if self.writable is None:
+            self.writable = Writable(self.wfd)
+            self.writable.notify_readiness(self._on_writable)
+        else:
+            self.writable.clear()
+
+    def _on_writable(self, writable, ready):
+        if not ready:
+            return
+        wbuf = self.wbuf
+        while self.wpos < len(wbuf):
+            n = self._write(buffer(wbuf, self.wpos))
+            if not n:
+                writable.clear()
+                return
+            self.wpos += n
+        self.wbuf = bytearray()
+        self.wpos = 0
+
+    def flush(self):
+        """
+        Block until all put values have been written to the pipe.
+        """
+        while self.wpos < len(self.wbuf):
+            n = self._write(buffer(self.wbuf, self.wpos))
+            if not n:
+                select.select([], [self.wfd], [])
+            self.wpos += n
+        self.wbuf = bytearray()
+        self.wpos = 0
+
+    def close_reader(self):
+        if self.readable is not None:
+            self.readable.cancel()
+        if self.rfd is not None:
+            os.close(self.rfd)
+            self.rfd = None
+
+    def close_writer(self):
+        if self.writable is not None:
+            self.writable.cancel()
+        if self.wfd is not None:
+            os.close(self.wfd)
+            self.wfd = None
+
+
+class Inbox(LogicalOr):
+    """
+    Several PipeQueues seen as one: it is ready when any of them
+    is, and get() returns a value from any of them.
+    """
+    def get(self):
+        return LogicalOr.get(self).get()
+
+
+def _after_fork():
+    # The parent's switcher (and its poller) must not be shared,
+    # and helper threads don't survive fork: let the new switcher
+    # run timers itself
+    current_switcher().close()
+    current_switcher.reset()
+    current_switcher().enable_timers()
+    # Objects driving helper threads would believe the parent's
+    # threads are still running (and their locks may be held):
+    # start afresh
+    pool.default_pool.reset()
+    pool.default_process_pool.reset()
+    popen._reaper = popen._Reaper()
+    Timer = timer.Timer
+    Timer.timethread = timer._TimerThread()
+    Timer.timethread_started = False
+    Timer.lock = Timer.timethread.get_lock()
+
+
+class Shards(object):
+    """
+    Runs softlets in several forked processes (shards), each with its
+    own switcher. Every pair of processes (including the parent) is
+    connected by PipeQueues: send() puts a value for another process,
+    and the "inbox" WaitObject receives the values sent to the
+    current process.
+    In the parent, "index" is None. In a shard, it is the index of
+    the shard, from 0 to nb_shards - 1.
+    """
+    def __init__(self, nb_shards):
+        """
+        Prepare "nb_shards" shards, and the queues between them.
+        """
+        self.nb_shards = nb_shards
+        self.index = None
+        self.pids = []
+        # queues[i][j] goes from process i to process j,
+        # the parent being process nb_shards
+        n = nb_shards + 1
+        self.queues = [[i != j and PipeQueue() or None for j in xrange(n)]
+            for i in xrange(n)]
+        self.inbox = None
+
+    def _process(self, index):
+        if index is None:
+            return self.nb_shards
+        return index
+
+    def start(self, func, *args, **kargs):
+        """
+        Fork the shards. Each one runs a Softlet created from
+        func(shards, *args, **kargs), until its softlets are finished.
+        """
+        for i in xrange(self.nb_shards):
+            pid = os.fork()
+            if not pid:
+                self._run_shard(i, func, args, kargs)
+            self.pids.append(pid)
+        self._setup()
+
+    def _setup(self):
+        # Close the pipe ends this process won't use
+        me = self._process(self.index)
+        incoming = []
+        for i, row in enumerate(self.queues):
+            for j, queue in enumerate(row):
+                if queue is None:
+                    continue
+                if i != me:
+                    queue.close_writer()
+                if j != me:
+                    queue.close_reader()
+                else:
+                    incoming.append(queue)
+        self.inbox = Inbox(incoming)
+
+    def _run_shard(self, index, func, args, kargs):
+        # Never returns
+        status = 1
+        try:
+            try:
+                self.index = index
+                self.pids = []
+                _after_fork()
+                self._setup()
+                Softlet(func(self, *args, **kargs))
+                main_loop()
+                for queue in self.queues[index]:
+                    if queue is not None:
+                        queue.flush()
+                status = 0
+            except:
+                traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def send(self, dest, value):
+        """
+        Send a value to shard "dest" (or to the parent if None).
+        """
+        me = self._process(self.index)
+        self.queues[me][self._process(dest)].put(value)
+
+    def wait(self):
+        """
+        Wait for the shards to exit (in the parent), and return their
+        exit statuses. Values sent to the parent should be received
+        before, otherwise shards may block on full pipes.
+        """
+        statuses = []
+        for pid in self.pids:
+            pid, status = os.waitpid(pid, 0)
+            statuses.append(status)
+        self.pids = []
+        return statuses
@@ -1,29 +1,69 @@
 
-from softlets.core import WaitObject
+from softlets.core import WaitObject, current_switcher
+from softlets.core import begin_async_batch, end_async_batch
 from softlets.timethread import TimeThread
 
 __all__ = ['Timer']
 
+
+class _TimerThread(TimeThread):
+    def fire(self, expired):
+        # All timers expired in a wakeup are delivered to the
+        # switcher in a single async call
+        begin_async_batch()
+        try:
+            TimeThread.fire(self, expired)
+        finally:
+            end_async_batch()
+
+
 class Timer(WaitObject):
     """
     This object becomes ready when a certain delay has expired.
+    If the switcher handles timers itself (see Switcher.enable_timers()),
+    the Timer is run by the switcher. Otherwise, it is run by a
+    helper thread.
+    If "slack" is not 0, the Timer may expire up to "slack" seconds
+    late, so that it can be expired together with other timers.
+    The default slack for all Timers is Timer.slack.
     """
-    timethread = TimeThread()
+    __slots__ = ('delay', '_slack', 'switcher', 'callback')
+    timethread = _TimerThread()
     timethread_started = False
     lock = timethread.get_lock()
+    slack = 0.0
 
-    def __init__(self, delay):
+    def __init__(self, delay, slack=None):
         WaitObject.__init__(self)
         self.delay = delay
+        # None means the default Timer.slack
+        self._slack = slack
         self.callback = None
-        self.is_async = True
-        self.protect()
-        if not Timer.timethread_started:
-            Timer.timethread.start()
-            Timer.timethread_started = True
+        switcher = current_switcher()
+        if switcher.timers is not None:
+            self.switcher = switcher
+        else:
+            self.switcher = None
+            self.is_async = True
+            self.protect()
+            if not Timer.timethread_started:
+                Timer.timethread.start()
+                Timer.timethread_started = True
         self.reschedule()
 
     def reschedule(self):
+        switcher = self.switcher
+        slack = self._slack
+        if slack is None:
+            slack = self.slack
+        if switcher is not None:
+            # In-thread, no locking needed
+            if self.callback:
+                switcher.remove_timer(self.callback)
+            self.set_ready(False)
+            self.callback = switcher.add_timer(self.delay,
+                self.on_delay_expired, slack=slack)
+            return
         # take the lock to ensure the callback doesn't
         # expire in the meantime
         try:
@@ -31,12 +71,14 @@ class Timer(WaitObject):
             if self.callback:
                 self.timethread.remove_timer(self.callback)
             self.set_ready(False)
-            self.callback = self.timethread.add_timer(self.delay, self.on_delay_expired, keep_lock=True)
+            self.callback = self.timethread.add_timer(self.delay,
+                self.on_delay_expired, keep_lock=True, slack=slack)
         finally:
             self.lock.release()
 
     def on_delay_expired(self):
         # the timethread has already taken the lock for us
+        # (or we are called in-thread by the switcher)
         self.set_ready(True)
         self.callback = None
 
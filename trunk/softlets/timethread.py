@@ -8,21 +8,33 @@ allocates a separate thread for each timer)
 import time
 import threading
 import atexit
-from heapq import heappush, heappop, heapify
+from collections import deque
 
 #from softlets.core.common import _singleton
 from softlets.util.namedtuple import NamedTuple
+from softlets.util.timerqueue import TimerHeap, TimingWheel, deadline
 
-__all__ = ['TimeThread']
+__all__ = ['TimeThread', 'TimerHeap', 'TimingWheel']
 
 _Callback = NamedTuple("timestamp", "func")
 
 
 class TimeThread(object):
-    def __init__(self):
-        self.callbacks = []
+    def __init__(self, timers=None):
+        """
+        Create a TimeThread. "timers" is the data structure holding
+        pending timers (see softlets.util.timerqueue), by default
+        a TimerHeap.
+        """
+        if timers is None:
+            timers = TimerHeap()
+        self.timers = timers
         self.interrupt = threading.Condition()
         self.running = False
+        # Timestamp the thread is sleeping until, if any
+        self.wakeup = None
+        # Callbacks expired but not yet called
+        self.expired = deque()
 
     def start(self):
         assert not self.running, "TimeThread already started"
@@ -30,15 +42,31 @@ class TimeThread(object):
             target=self.run,
             name="TimeThread polling thread")
         self.thread.setDaemon(True)
-        self.thread.start()
+        # Must be set before the thread starts, otherwise it could
+        # see running == False and exit immediately
         self.running = True
+        self.thread.start()
         atexit.register(self.finish)
 
     def get_lock(self):
         return self.interrupt
 
-    def add_timer(self, delay, func, keep_lock=False):
-        timestamp = time.time() + delay
+    def set_timers(self, timers):
+        """
+        Replace the data structure holding pending timers,
+        e.g. with a TimingWheel. Pending timers are transferred.
+        """
+        try:
+            self.interrupt.acquire()
+            for callback in self.timers.entries():
+                timers.add(callback)
+            self.timers = timers
+            self.interrupt.notify()
+        finally:
+            self.interrupt.release()
+
+    def add_timer(self, delay, func, keep_lock=False, slack=0.0):
+        timestamp = deadline(delay, slack)
         if not keep_lock:
             # If not asked otherwise, release the lock
             # in case the func() wants to add/remove other callbacks
@@ -52,8 +80,8 @@ class TimeThread(object):
         callback = _Callback(timestamp, func)
         try:
             self.interrupt.acquire()
-            heappush(self.callbacks, callback)
-            if self.callbacks[0] is callback:
+            self.timers.add(callback)
+            if self.wakeup is None or timestamp < self.wakeup:
                 self.interrupt.notify()
         finally:
             self.interrupt.release()
@@ -63,19 +91,21 @@ class TimeThread(object):
         try:
             self.interrupt.acquire()
             try:
-                if self.callbacks[0] is callback:
-                    self.interrupt.notify()
-                self.callbacks.remove(callback)
-            except (ValueError, IndexError):
-                raise ValueError("cannot remove unknown timer '%s'" % str(callback))
-            heapify(self.callbacks)
+                self.timers.remove(callback)
+            except ValueError:
+                # Maybe it has expired but not been called yet
+                try:
+                    self.expired.remove(callback)
+                except ValueError:
+                    raise ValueError("cannot remove unknown timer '%s'" % str(callback))
         finally:
             self.interrupt.release()
 
     def finish(self):
         self.interrupt.acquire()
         self.running = False
-        self.callbacks = []
+        self.timers = TimerHeap()
+        self.expired.clear()
         self.interrupt.notify()
         self.interrupt.release()
         self.thread.join()
@@ -84,22 +114,33 @@ class TimeThread(object):
         try:
             self.interrupt.acquire()
             while self.running:
-                if not self.callbacks:
+                deadline = self.timers.next_deadline()
+                if deadline is None:
+                    self.wakeup = None
                     self.interrupt.wait()
                     continue
-                cb = self.callbacks[0]
-                timeout = cb.timestamp - time.time()
+                timeout = deadline - time.time()
                 if timeout > 0:
-                    r = self.interrupt.wait(timeout)
-                    # If the next callback has changed at return, it means we
-                    # have been interrupted by the main thread
-                    if not self.callbacks or cb is not self.callbacks[0]:
-                        continue
-                heappop(self.callbacks)
-                cb.func()
+                    # We may be interrupted by the main thread if
+                    # an earlier timer is added
+                    self.wakeup = deadline
+                    self.interrupt.wait(timeout)
+                    continue
+                self.wakeup = None
+                expired = self.expired
+                expired.extend(self.timers.pop_expired(time.time()))
+                self.fire(expired)
         finally:
             self.interrupt.release()
 
+    def fire(self, expired):
+        """
+        Call the callbacks expired in a wakeup (a deque which is
+        emptied as they are called). Can be overriden to wrap the
+        whole batch.
+        """
+        while expired:
+            expired.popleft().func()
 
-#TimeThread = _singleton(_TimeThread)
 
+#TimeThread = _singleton(_TimeThread)
@@ -0,0 +1,204 @@
+"""
+Data structures holding pending timers.
+Timers are tuples whose first element is the expiry timestamp
+(e.g. TimeThread's callbacks). All backends have the same interface:
+- add(timer) and remove(timer)
+- next_deadline(): the timestamp at which pop_expired() should be
+  called next, or None if there aren't any timers
+- pop_expired(now): remove and return all timers expired at "now"
+"""
+
+from math import ceil, floor
+from heapq import heappush, heappop, heapify
+import time
+
+__all__ = ['TimerHeap', 'TimingWheel', 'deadline']
+
+
+def deadline(delay, slack=0.0):
+    """
+    Compute the expiry timestamp of a timer armed now for "delay"
+    seconds. If "slack" is not 0, the timer may expire up to "slack"
+    seconds late: the timestamp is rounded up to a multiple of "slack",
+    so that timers expiring in the same window are expired together.
+    """
+    timestamp = time.time() + delay
+    if slack:
+        timestamp = ceil(timestamp / slack) * slack
+    return timestamp
+
+
+class TimerHeap(object):
+    """
+    Timers in a binary heap: O(log n) add, O(n) remove.
+    Expiry is exact.
+    """
+    def __init__(self):
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def entries(self):
+        return list(self.heap)
+
+    def add(self, timer):
+        heappush(self.heap, timer)
+
+    def remove(self, timer):
+        try:
+            self.heap.remove(timer)
+        except ValueError:
+            raise ValueError("cannot remove unknown timer '%s'" % str(timer))
+        heapify(self.heap)
+
+    def next_deadline(self):
+        if not self.heap:
+            return None
+        return self.heap[0][0]
+
+    def pop_expired(self, now):
+        heap = self.heap
+        expired = []
+        while heap and heap[0][0] <= now:
+            expired.append(heappop(heap))
+        return expired
+
+
+class TimingWheel(object):
+    """
+    Timers in a hierarchical timing wheel: O(1) add and remove.
+    Time is divided in ticks of "resolution" seconds, and timers
+    expire at the end of the tick their timestamp falls in.
+    Level 0 has one slot per tick; each upper level has slots
+    spanning a whole revolution of the level below, and is cascaded
+    down when that revolution starts.
+    """
+    def __init__(self, resolution=0.001, bits=8, levels=4):
+        self.resolution = resolution
+        self.bits = bits
+        self.nb_slots = 1 << bits
+        self.mask = self.nb_slots - 1
+        self.levels = levels
+        # All levels are flattened in a single list of slots (sets),
+        # allocated lazily
+        self.slots = [None] * (levels << bits)
+        self.counts = [0] * levels
+        # Maps each timer to its position in self.slots
+        self.positions = {}
+        # Next tick to be processed
+        self.current = int(floor(time.time() / resolution))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def entries(self):
+        return self.positions.keys()
+
+    def _place(self, timer, tick):
+        delta = tick - self.current
+        if delta < 0:
+            # Overdue: fire at next processed tick
+            tick = self.current
+            delta = 0
+        bits = self.bits
+        level = 0
+        top = self.levels - 1
+        while level < top and delta >> (bits * (level + 1)):
+            level += 1
+        pos = (level << bits) | ((tick >> (bits * level)) & self.mask)
+        slot = self.slots[pos]
+        if slot is None:
+            slot = self.slots[pos] = set()
+        slot.add(timer)
+        self.positions[timer] = pos
+        self.counts[level] += 1
+
+    def add(self, timer):
+        if not self.positions:
+            # Nothing has been processed while empty, catch up
+            self.current = int(floor(time.time() / self.resolution))
+        self._place(timer, int(ceil(timer[0] / self.resolution)))
+
+    def remove(self, timer):
+        try:
+            pos = self.positions.pop(timer)
+        except KeyError:
+            raise ValueError("cannot remove unknown timer '%s'" % str(timer))
+        self.slots[pos].remove(timer)
+        self.counts[pos >> self.bits] -= 1
+
+    def _lowest_level(self):
+        # Lowest level with pending timers, or None
+        for level, count in enumerate(self.counts):
+            if count:
+                return level
+        return None
+
+    def next_deadline(self):
+        current = self.current
+        tick = None
+        # Next time an upper level is cascaded
+        for level in xrange(1, self.levels):
+            if self.counts[level]:
+                span = 1 << (self.bits * level)
+                tick = (current + span - 1) & ~(span - 1)
+                break
+        if self.counts[0]:
+            slots = self.slots
+            mask = self.mask
+            for t in xrange(current, tick or current + self.nb_slots):
+                if slots[t & mask]:
+                    tick = t
+                    break
+        if tick is None:
+            return None
+        return tick * self.resolution
+
+    def _cascade(self, tick):
+        bits = self.bits
+        slots = self.slots
+        for level in xrange(self.levels - 1, 0, -1):
+            if tick & ((1 << (bits * level)) - 1):
+                continue
+            pos = (level << bits) | ((tick >> (bits * level)) & self.mask)
+            slot = slots[pos]
+            if not slot:
+                continue
+            slots[pos] = None
+            self.counts[level] -= len(slot)
+            for timer in slot:
+                self._place(timer, int(ceil(timer[0] / self.resolution)))
+
+    def pop_expired(self, now):
+        target = int(floor(now / self.resolution))
+        bits = self.bits
+        slots = self.slots
+        positions = self.positions
+        expired = []
+        while self.current <= target:
+            tick = self.current
+            level = self._lowest_level()
+            if level is None:
+                self.current = target + 1
+                break
+            if level > 0:
+                # Skip empty ticks up to the next cascade
+                span = 1 << (bits * level)
+                if tick & (span - 1):
+                    tick = (tick | (span - 1)) + 1
+                    if tick > target:
+                        self.current = target + 1
+                        break
+                    self.current = tick
+            self._cascade(tick)
+            pos = tick & self.mask
+            slot = slots[pos]
+            if slot:
+                slots[pos] = None
+                self.counts[0] -= len(slot)
+                for timer in slot:
+                    del positions[timer]
+                expired.extend(slot)
+            self.current = tick + 1
+        return expired